@@ -89,7 +89,7 @@ def check_tool_version() -> None:
             return
         with r_context as r:
             try:
-                latest_version: str = json.loads(s=r.read().decode())["tag_name"]
+                latest_version: str = json.load(r)["tag_name"]
             except Exception as e:
                 LOG.debug(e)
                 LOG.error("Could not verify the latest release.")
@@ -1,13 +1,16 @@
 import json
 from datetime import datetime, timezone
+from typing import TYPE_CHECKING
 
-import requests
 import rich
 import typer
 from typing_extensions import Annotated
 
 from ctf.common.logger import LOG
 
+if TYPE_CHECKING:
+    import requests
+
 app = typer.Typer()
 
 
@@ -22,6 +25,8 @@ def stats(
         bool, typer.Option("--html", help="Generate an HTML report (stats.html).")
     ] = False,
 ) -> None:
+    import requests
+
     stats = {}
     session = requests.Session()
     session.base_url = askgod_url + "/1.0"
@@ -418,7 +423,9 @@ new Chart(document.getElementById('overTimeChart'), {{
 </html>"""
 
 
-def get(session: requests.Session, url: str) -> dict:
+def get(session: "requests.Session", url: str) -> dict:
+    import requests
+
     try:
         response = session.get(url=f"{session.base_url}{url}", verify=False)
         response.raise_for_status()
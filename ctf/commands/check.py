@@ -6,7 +6,7 @@ from typing_extensions import Annotated
 from ctf import ENV
 from ctf.commands.generate import generate
 from ctf.common.logger import LOG
-from ctf.common.utils import check_git_lfs, find_ctf_root_directory, terraform_binary
+from ctf.common.utils import check_git_lfs, get_deploy_directory, terraform_binary
 
 app = typer.Typer()
 
@@ -45,7 +45,7 @@ def check(
     # Then run terraform plan.
     subprocess.run(
         args=[terraform_binary(), "plan"],
-        cwd=find_ctf_root_directory() / ".deploy",
+        cwd=get_deploy_directory(),
         check=True,
     )
 
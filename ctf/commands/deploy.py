@@ -1,24 +1,23 @@
+import ipaddress
 import json
 import os
 import shutil
 import subprocess
-import textwrap
+import sys
 import time
 from pathlib import Path
 
 import typer
-from rich.prompt import IntPrompt
 from typing_extensions import Annotated
 
 from ctf import ENV, STATE
-from ctf.commands.destroy import destroy
 from ctf.commands.generate import generate
 from ctf.common.logger import LOG
 from ctf.common.models import Track, TrackYaml
 from ctf.common.utils import (
     add_tracks_to_terraform_modules,
     check_git_lfs,
-    find_ctf_root_directory,
+    get_deploy_directory,
     parse_track_yaml,
     remove_tracks_from_terraform_modules,
     terraform_binary,
@@ -26,6 +25,8 @@ from ctf.common.utils import (
 
 app = typer.Typer()
 
+TERRAFORM_STATE_LOCK_ERROR = "Error acquiring the state lock"
+
 
 @app.command(help="Deploy and provision the tracks")
 def deploy(
@@ -147,6 +148,11 @@ def deploy(
     ):
         distinct_tracks = regenerated_tracks
 
+    # The Ansible variables are the same for every track, only the VM project differs.
+    extra_args: list[str] = ansible_extra_args(
+        remote=remote, production=production, vm_remote=vm_remote
+    )
+
     # Starting a timer for tracks with a virtual machine in them.
     start_timer: float = time.time()
 
@@ -157,14 +163,14 @@ def deploy(
             t.name,
         ),  # Running ansible on containers first then virtual machines
     ):
+        path: Path = track.location / "ansible"
+
         if not skip_build and track.require_build_container:
             run_ansible_playbook(
-                remote=remote,
-                production=production,
                 track=track.name,
-                path=find_ctf_root_directory() / "challenges" / track.name / "ansible",
+                path=path,
+                extra_args=extra_args,
                 playbook="build.yaml",
-                vm_remote=vm_remote,
                 vm_project=vm_project,
                 execute_common=False,
             )
@@ -186,28 +192,34 @@ def deploy(
                 ):
                     distinct_tracks = regenerated_tracks
 
-        if not (
-            path := find_ctf_root_directory() / "challenges" / track.name / "ansible"
-        ).exists():
+        if not path.exists():
             continue
 
         if track.has_virtual_machine:
-            incus_list = json.loads(
-                subprocess.run(
-                    args=["incus", "list", f"--project={track}", "--format", "json"],
-                    check=True,
-                    capture_output=True,
-                    env=ENV,
-                ).stdout.decode()
-            )
+            # Only the virtual machine names are needed, json.loads accepts the raw bytes.
+            virtual_machines: list[str] = [
+                machine["name"]
+                for machine in json.loads(
+                    subprocess.run(
+                        args=[
+                            "incus",
+                            "list",
+                            f"--project={track}",
+                            "--format",
+                            "json",
+                        ],
+                        check=True,
+                        capture_output=True,
+                        env=ENV,
+                    ).stdout
+                )
+                if machine["type"] == "virtual-machine"
+            ]
 
             # Waiting for virtual machine to be up and running
             # Starting with a minute
             if start_timer > time.time() - (seconds := 30):
-                for machine in incus_list:
-                    if machine["type"] != "virtual-machine":
-                        continue
-
+                for machine_name in virtual_machines:
                     cmd: str = "whoami"  # Should works on most OS
                     while start_timer > time.time() - seconds:
                         # Avoid spamming too much, sleeping for a second between each request.
@@ -219,7 +231,7 @@ def deploy(
                                 "exec",
                                 f"--project={track}",
                                 "-T",
-                                machine["name"],
+                                machine_name,
                                 "--",
                                 cmd,
                             ],
@@ -243,11 +255,9 @@ def deploy(
                                 )
 
         run_ansible_playbook(
-            remote=remote,
-            production=production,
             track=track.name,
             path=path,
-            vm_remote=vm_remote,
+            extra_args=extra_args,
             vm_project=vm_project,
             skip_pre_common=skip_pre_common,
             skip_post_common=skip_post_common,
@@ -260,23 +270,35 @@ def deploy(
         add_tracks_to_terraform_modules({track})
 
         if not production:
-            incus_list = json.loads(
-                s=subprocess.run(
+            ipv6_to_container_name = {}
+            for machine in json.loads(
+                subprocess.run(
                     args=["incus", "list", f"--project={track}", "--format", "json"],
                     check=True,
                     capture_output=True,
                     env=ENV,
-                ).stdout.decode()
-            )
-            ipv6_to_container_name = {}
-            for machine in incus_list:
+                ).stdout
+            ):
                 if machine["type"] == "virtual-machine":
                     continue
                 addresses = machine["state"]["network"]["eth0"]["addresses"]
-                ipv6_address = list(
-                    filter(lambda address: address["family"] == "inet6", addresses)
-                )[0]["address"]
-                ipv6_to_container_name[ipv6_address] = machine["name"]
+                if not (
+                    ipv6_address := next(
+                        (
+                            address["address"]
+                            for address in addresses
+                            if address["family"] == "inet6"
+                        ),
+                        None,
+                    )
+                ):
+                    LOG.warning(
+                        f"No IPv6 address found for {machine['name']} in project {track}. Skipping..."
+                    )
+                    continue
+                ipv6_to_container_name[str(ipaddress.IPv6Address(ipv6_address))] = (
+                    machine["name"]
+                )
 
             LOG.debug(f"Mapping: {ipv6_to_container_name}")
 
@@ -299,27 +321,16 @@ def deploy(
                             }
 
                 for service_name, service in services.items():
-                    if (
-                        service.get("dev_port_mapping")
-                        and (
-                            str(service["address"])
-                            .replace(":0", ":")
-                            .replace(":0", ":")
-                            .replace(":0", ":")
-                            .replace(":0", ":")
+                    if service.get("dev_port_mapping") and (
+                        machine_name := container_name_for_address(
+                            track=track,
+                            address=service.get("address"),
+                            ipv6_to_container_name=ipv6_to_container_name,
                         )
-                        in ipv6_to_container_name
                     ):
                         LOG.debug(
                             f"Adding incus proxy for service {track}-{service_name}-port-{service['port']}"
                         )
-                        machine_name = ipv6_to_container_name[
-                            str(service["address"])
-                            .replace(":0", ":")
-                            .replace(":0", ":")
-                            .replace(":0", ":")
-                            .replace(":0", ":")
-                        ]
                         subprocess.run(
                             args=[
                                 "incus",
@@ -360,12 +371,14 @@ def deploy(
             exit(1)
 
     if not production and distinct_tracks:
+        import textwrap
+
         tracks_list = list(distinct_tracks)
         track_index = input(
             textwrap.dedent(
                 f"""\
                 Do you want to `incus project switch` to any of the tracks mentioned in argument?
-                {chr(10).join([f"{list(tracks_list).index(t) + 1}) {t}" for t in tracks_list])}
+                {chr(10).join(f"{i}) {t}" for i, t in enumerate(tracks_list, start=1))}
 
                 Which? """
             )
@@ -386,6 +399,24 @@ def deploy(
             LOG.warning(f"Could not switch project, unrecognized input: {track_index}.")
 
 
+def container_name_for_address(
+    track: Track,
+    address: str | int | None,
+    ipv6_to_container_name: dict[str, str],
+) -> str | None:
+    if not address:
+        return None
+
+    # Addresses are compared in their canonical form, as Incus reports them.
+    try:
+        canonical_address = str(ipaddress.IPv6Address(address))
+    except ValueError:
+        LOG.warning(f"Invalid IPv6 address {address} in track {track}. Skipping...")
+        return None
+
+    return ipv6_to_container_name.get(canonical_address)
+
+
 def terraform_apply(
     tracks: list[str],
     exclude_tracks: list[str],
@@ -397,59 +428,74 @@ def terraform_apply(
     args = [terraform_binary(), "apply", "-auto-approve"]
 
     try:
-        subprocess.run(
-            args=args,
-            cwd=find_ctf_root_directory() / ".deploy",
-            check=True,
-        )
-    except subprocess.CalledProcessError:
+        run_terraform_apply(args=args)
+    except subprocess.CalledProcessError as e:
+        # The local backend only holds the lock while another tofu process is running,
+        # destroying or retrying would race with it.
+        if TERRAFORM_STATE_LOCK_ERROR in e.stderr:
+            LOG.critical(
+                f"The state is locked by another running {os.path.basename(terraform_binary())} process. Wait for it to finish and deploy again."
+            )
+            exit(1)
+
+        # Only needed when recovering from a failed deployment.
+        from rich.prompt import IntPrompt
+
+        from ctf.commands.destroy import destroy
+
         LOG.warning(
             f"The project could not deploy due to instable state. It is often due to CTRL+C while deploying as {os.path.basename(terraform_binary())} was not able to save the state of each object created."
         )
 
-        match IntPrompt.ask(
-            "Do you want to start over (1), clean up (2) or quit (3)?",
-            choices=["1", "2", "3"],
-            default=1,
-        ):
-            case 1:
-                destroy(
-                    tracks=tracks,
-                    exclude_tracks=exclude_tracks,
-                    production=production,
-                    remote=remote,
-                    force=True,
-                )
-
-                distinct_tracks = generate(
-                    tracks=tracks,
-                    exclude_tracks=exclude_tracks,
-                    production=production,
-                    remote=remote,
-                    vm_remote=vm_remote,
-                    vm_project=vm_project,
-                )
-
-                subprocess.run(
-                    args=args,
-                    cwd=find_ctf_root_directory() / ".deploy",
-                    check=True,
-                )
-
-                return distinct_tracks
-            case 2:
-                destroy(
-                    tracks=tracks,
-                    exclude_tracks=exclude_tracks,
-                    production=production,
-                    remote=remote,
-                    force=True,
-                )
-                exit(0)
-            case 3:
-                exit(1)
+        while True:
+            match IntPrompt.ask(
+                "Do you want to start over (1), clean up (2), quit (3) or retry (4)?",
+                choices=["1", "2", "3", "4"],
+                default=1,
+            ):
+                case 1:
+                    destroy(
+                        tracks=tracks,
+                        exclude_tracks=exclude_tracks,
+                        production=production,
+                        remote=remote,
+                        force=True,
+                    )
+
+                    distinct_tracks = generate(
+                        tracks=tracks,
+                        exclude_tracks=exclude_tracks,
+                        production=production,
+                        remote=remote,
+                        vm_remote=vm_remote,
+                        vm_project=vm_project,
+                    )
+
+                    subprocess.run(
+                        args=args,
+                        cwd=get_deploy_directory(),
+                        check=True,
+                    )
+
+                    return distinct_tracks
+                case 2:
+                    destroy(
+                        tracks=tracks,
+                        exclude_tracks=exclude_tracks,
+                        production=production,
+                        remote=remote,
+                        force=True,
+                    )
+                    exit(0)
+                case 3:
+                    exit(1)
+                case 4:
+                    if terraform_retry():
+                        return set()
 
     except KeyboardInterrupt:
+        from ctf.commands.destroy import destroy
+
         LOG.warning(
             "CTRL+C was detected during Terraform deployment. Destroying everything..."
         )
@@ -465,18 +511,58 @@ def terraform_apply(
     return set()
 
 
-def run_ansible_playbook(
+def run_terraform_apply(args: list[str]) -> None:
+    # stderr is echoed as it comes and kept to tell a state lock error apart.
+    stderr: list[str] = []
+    with subprocess.Popen(
+        args=args,
+        cwd=get_deploy_directory(),
+        stderr=subprocess.PIPE,
+        text=True,
+    ) as process:
+        assert process.stderr is not None
+        for line in process.stderr:
+            sys.stderr.write(line)
+            stderr.append(line)
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(
+            returncode=process.returncode, cmd=args, stderr="".join(stderr)
+        )
+
+
+def terraform_retry() -> bool:
+    # Most failed applies are partial: refresh the state and apply again before
+    # resorting to a destroy.
+    LOG.info("Retrying the failed Terraform apply...")
+    deploy_directory: Path = get_deploy_directory()
+
+    try:
+        subprocess.run(
+            args=[terraform_binary(), "apply", "-refresh-only", "-auto-approve"],
+            cwd=deploy_directory,
+            check=True,
+        )
+
+        # Tainted resources are replaced and missing ones created, the rest is left as is.
+        subprocess.run(
+            args=[terraform_binary(), "apply", "-auto-approve"],
+            cwd=deploy_directory,
+            check=True,
+        )
+    except subprocess.CalledProcessError:
+        LOG.warning("Could not recover from the failed Terraform apply.")
+        return False
+
+    LOG.info("Recovered from the failed Terraform apply.")
+    return True
+
+
+def ansible_extra_args(
     remote: str,
     production: bool,
-    track: str,
-    path: Path,
-    playbook: str = "deploy.yaml",
     vm_remote: str | None = None,
-    vm_project: str | None = None,
-    execute_common: bool = True,
-    skip_pre_common: bool = False,
-    skip_post_common: bool = False,
-) -> None:
+) -> list[str]:
     extra_args = []
     if STATE["verbose"]:
         extra_args.append("-vvv")
@@ -486,35 +572,53 @@ def run_ansible_playbook(
         f"ansible_incus_container_remote={remote}",
         "-e",
         f"ansible_incus_vm_remote={vm_remote if vm_remote else remote}",
-        "-e",
-        f"ansible_incus_vm_project={vm_project if vm_project else track}",
     ]
 
     if production:
         extra_args += ["-e", "nsec_production=true"]
 
+    return extra_args
+
+
+def run_ansible_playbook(
+    track: str,
+    path: Path,
+    extra_args: list[str],
+    playbook: str = "deploy.yaml",
+    vm_project: str | None = None,
+    execute_common: bool = True,
+    skip_pre_common: bool = False,
+    skip_post_common: bool = False,
+) -> None:
+    extra_args = extra_args + [
+        "-e",
+        f"ansible_incus_vm_project={vm_project if vm_project else track}",
+    ]
+
+    # Pre-common and the track playbook share the same variables, so they are run
+    # in a single ansible-playbook invocation to only pay Ansible's startup once.
+    playbooks: list[str] = [playbook]
     if not skip_pre_common and execute_common:
-        LOG.info(f"Running pre-common.yaml with ansible for track {track}...")
-        ansible_args = [
-            "ansible-playbook",
-            os.path.join("..", "..", "..", ".deploy", "ansible", "common.yaml"),
-            "-i",
-            "inventory",
-        ] + extra_args
-        subprocess.run(
-            args=ansible_args,
-            cwd=path,
-            check=True,
+        playbooks.insert(
+            0, os.path.join("..", "..", "..", ".deploy", "ansible", "common.yaml")
+        )
+        LOG.info(
+            f"Running pre-common.yaml and {playbook} with ansible for track {track}..."
         )
+    else:
+        LOG.info(f"Running {playbook} with ansible for track {track}...")
 
-    LOG.info(f"Running {playbook} with ansible for track {track}...")
     ansible_args = [
         "ansible-playbook",
-        playbook,
+        *playbooks,
         "-i",
         "inventory",
     ] + extra_args
-    subprocess.run(args=ansible_args, cwd=path, check=True)
+    run_ansible(
+        args=ansible_args,
+        cwd=path,
+        log_file=ansible_log_directory() / f"{track}-{Path(playbook).stem}.log",
+    )
 
     if not skip_post_common and execute_common:
         LOG.info(f"Running post-common.yaml with ansible for track {track}...")
@@ -528,11 +632,41 @@ def run_ansible_playbook(
             + extra_args
             + ["-e", "nsec_post_deployment=true"]
         )
-        subprocess.run(
+        run_ansible(
             args=ansible_args,
             cwd=path,
-            check=True,
+            log_file=ansible_log_directory() / f"{track}-post-common.log",
         )
 
     if (artifacts_path := path / "artifacts").exists():
         shutil.rmtree(artifacts_path)
+
+
+def ansible_log_directory() -> Path:
+    # Kept out of the CTF repository and private to the user, the logs may contain secrets.
+    return (
+        Path(
+            os.environ.get(
+                "XDG_STATE_HOME",
+                Path(os.environ.get("HOME", "~")).expanduser() / ".local" / "state",
+            )
+        )
+        / "ctf-script"
+        / "ansible-logs"
+    )
+
+
+def run_ansible(args: list[str], cwd: Path, log_file: Path) -> None:
+    # Ansible keeps writing to the terminal and tees its output to the log file itself.
+    env = ENV
+    if "ANSIBLE_LOG_PATH" not in env:
+        log_file.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        log_file.unlink(missing_ok=True)
+        LOG.debug(f"Writing Ansible output to {log_file}")
+        env = {**ENV, "ANSIBLE_LOG_PATH": str(log_file)}
+
+    try:
+        subprocess.run(args=args, cwd=cwd, check=True, env=env)
+    except subprocess.CalledProcessError:
+        LOG.error(f"Ansible failed, see {env['ANSIBLE_LOG_PATH']} for the full output.")
+        raise
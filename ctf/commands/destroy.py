@@ -1,8 +1,8 @@
-import json
+import csv
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 import typer
-from pydantic import ValidationError
 from rich.prompt import Confirm
 from typing_extensions import Annotated
 
@@ -10,7 +10,7 @@ from ctf import ENV
 from ctf.common.logger import LOG
 from ctf.common.models import Track
 from ctf.common.utils import (
-    find_ctf_root_directory,
+    get_deploy_directory,
     get_terraform_tracks_from_modules,
     remove_tracks_from_terraform_modules,
     terraform_binary,
@@ -65,7 +65,7 @@ def destroy(
 ) -> None:
     ENV["INCUS_REMOTE"] = remote
 
-    if not (find_ctf_root_directory() / ".deploy" / "modules.tf").exists():
+    if not ((deploy_directory := get_deploy_directory()) / "modules.tf").exists():
         LOG.critical("Nothing to destroy.")
         exit(1)
 
@@ -73,53 +73,34 @@ def destroy(
 
     total_deployed_tracks = len(terraform_tracks)
 
-    terraform_tracks -= {Track(name=x) for x in exclude_tracks}
-
-    current_project = Track(
-        name=subprocess.run(
-            args=["incus", "project", "get-current"],
-            check=True,
-            capture_output=True,
-            env=ENV,
-        )
-        .stdout.decode()
-        .strip()
-    )
-
-    tmp_tracks: set[Track] = {Track(name=x) for x in tracks}
-    if tmp_tracks and tmp_tracks != terraform_tracks:
-        terraform_tracks &= tmp_tracks
+    selected_tracks = frozenset(tracks)
+    excluded_tracks = frozenset(exclude_tracks)
+    if selected_tracks or excluded_tracks:
+        terraform_tracks = {
+            track
+            for track in terraform_tracks
+            if (not selected_tracks or track.name in selected_tracks)
+            and track.name not in excluded_tracks
+        }
 
     if not terraform_tracks:
         LOG.warning("No track to destroy.")
         return
 
-    if current_project in terraform_tracks:
-        projects: set[Track] = {
-            Track(name=project["name"])
-            for project in json.loads(
-                s=subprocess.run(
-                    args=["incus", "project", "list", "--format=json"],
-                    check=False,
-                    capture_output=True,
-                    env=ENV,
-                ).stdout.decode()
-            )
-        }
+    track_names: frozenset[str] = frozenset(track.name for track in terraform_tracks)
 
-        project_list = list((projects - terraform_tracks))
-        if len(project_list) == 0:
-            LOG.critical(
-                "No project to switch to. This should never happen as the default should always exists."
-            )
-            exit(1)
+    # Only ask Incus for the current project once we know there is something to destroy.
+    current_project: str = subprocess.run(
+        args=["incus", "project", "get-current"],
+        check=True,
+        capture_output=True,
+        text=True,
+        env=ENV,
+    ).stdout.strip()
 
-        cmd = [
-            "incus",
-            "project",
-            "switch",
-            "default" if "default" in project_list else project_list[0].name,
-        ]
+    if current_project in track_names:
+        # The default project can't be deleted in Incus, so it is always a valid target.
+        cmd = ["incus", "project", "switch", "default"]
 
         LOG.info(f"Running `{' '.join(cmd)}`")
         subprocess.run(args=cmd, check=True, env=ENV)
@@ -137,132 +118,142 @@ def destroy(
                 ]
             ),
         ],
-        cwd=find_ctf_root_directory() / ".deploy",
+        cwd=deploy_directory,
         check=False,
     )
 
-    projects = {
-        Track(name=project["name"])
-        for project in json.loads(
-            s=subprocess.run(
-                args=["incus", "project", "list", "--format=json"],
-                check=False,
-                capture_output=True,
-                env=ENV,
-            ).stdout.decode()
+    delete_leftover_artefacts(
+        track_names=track_names,
+        destroy_everything=total_deployed_tracks == len(terraform_tracks),
+        force=force,
+    )
+
+    remove_tracks_from_terraform_modules(
+        tracks=terraform_tracks,
+        remote=remote,
+        production=production,
+    )
+    if total_deployed_tracks == len(terraform_tracks):
+        LOG.info("Successfully destroyed every track")
+    else:
+        LOG.info(
+            f"Successfully destroyed: {', '.join([track.name for track in terraform_tracks])}"
         )
-    }
 
-    networks = set()
-    for network in json.loads(
-        s=subprocess.run(
-            args=["incus", "network", "list", "--format=json"],
-            check=False,
-            capture_output=True,
-            env=ENV,
-        ).stdout.decode()
-    ):
-        try:
-            networks.add(Track(name=network["name"]))
-        except ValidationError:
-            pass
 
-    network_acls = {
-        Track(name=network_acl["name"])
-        for network_acl in json.loads(
-            s=subprocess.run(
-                args=["incus", "network", "acl", "list", "--format=json"],
-                check=False,
-                capture_output=True,
-                env=ENV,
-            ).stdout.decode()
+def delete_leftover_artefacts(
+    track_names: frozenset[str], destroy_everything: bool, force: bool
+) -> None:
+    # The four listings are independent, so they are fetched concurrently.
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        (
+            remaining_projects,
+            remaining_networks,
+            remaining_network_acls,
+            remaining_network_zones,
+        ) = executor.map(
+            lambda object_type: incus_object_names(*object_type),
+            (("project",), ("network",), ("network", "acl"), ("network", "zone")),
         )
-    }
 
-    network_zones = {
-        Track(name=network_zone["name"])
-        for network_zone in json.loads(
-            s=subprocess.run(
-                args=["incus", "network", "zone", "list", "--format=json"],
-                check=False,
-                capture_output=True,
-                env=ENV,
-            ).stdout.decode()
-        )
+    # Only keep the artefacts that belong to the destroyed tracks.
+    leftovers: dict[str, list[str]] = {
+        "project": sorted(remaining_projects & track_names),
+        "network": sorted(remaining_networks & {name[:15] for name in track_names}),
+        "network ACL": sorted(
+            remaining_network_acls
+            & (track_names | {f"{name}-default" for name in track_names})
+        ),
+        "network zone": [],
     }
+    if destroy_everything:
+        if "simulated-production-acl" in remaining_network_acls:
+            leftovers["network ACL"].append("simulated-production-acl")
+        if "ctf" in remaining_network_zones:
+            leftovers["network zone"].append("ctf")
 
-    for module in terraform_tracks:
-        if module in projects:
-            LOG.warning(f"The project {module.name} was not destroyed properly.")
-            if force or Confirm.ask("Do you want to destroy it?", default=True):
-                subprocess.run(
-                    args=["incus", "project", "delete", module.name, "--force"],
-                    check=False,
-                    capture_output=True,
-                    input=b"yes\n",
-                    env=ENV,
-                )
-
-        if (tmp_module_name := module.name[:15]) in networks:
-            LOG.warning(f"The network {tmp_module_name} was not destroyed properly.")
-            if force or Confirm.ask("Do you want to destroy it?", default=True):
-                subprocess.run(
-                    args=["incus", "network", "delete", tmp_module_name],
-                    check=False,
-                    capture_output=True,
-                    env=ENV,
-                )
+    if not (total := sum(len(names) for names in leftovers.values())):
+        return
 
-        if (tmp_module := module) in network_acls or (
-            tmp_module := Track(name=f"{module.name}-default")
-        ) in network_acls:
-            LOG.warning(
-                f"The network ACL {tmp_module.name} was not destroyed properly."
-            )
-            if force or Confirm.ask("Do you want to destroy it?", default=True):
-                subprocess.run(
-                    args=["incus", "network", "acl", "delete", tmp_module.name],
-                    check=False,
-                    capture_output=True,
-                    env=ENV,
-                )
+    for kind, names in leftovers.items():
+        for name in names:
+            LOG.warning(f"The {kind} {name} was not destroyed properly.")
 
-    if (
-        total_deployed_tracks == len(terraform_tracks)
-        and Track(name="ctf") in network_zones
+    if not force and not Confirm.ask(
+        f"Do you want to destroy these {total} leftover artefact(s)?", default=True
     ):
-        LOG.warning('The network zone "ctf" was not destroyed properly.')
-        if force or Confirm.ask("Do you want to destroy it?", default=True):
-            subprocess.run(
-                args=["incus", "network", "zone", "delete", "ctf"],
-                check=False,
-                capture_output=True,
-                env=ENV,
-            )
+        return
 
-    if (
-        total_deployed_tracks == len(terraform_tracks)
-        and Track(name="simulated-production-acl") in network_acls
+    # Deletions of a same kind are independent and run concurrently, but each kind waits
+    # for the previous one: a network is in use until its project is gone, and an ACL
+    # until its network is gone.
+    for kind, commands, confirmation in (
+        (
+            "project",
+            [
+                ["incus", "project", "delete", project, "--force"]
+                for project in leftovers["project"]
+            ],
+            # `incus project delete --force` still asks for a confirmation on stdin.
+            b"yes\n",
+        ),
+        (
+            "network",
+            [
+                ["incus", "network", "delete", network]
+                for network in leftovers["network"]
+            ],
+            None,
+        ),
+        (
+            "network ACL",
+            [
+                ["incus", "network", "acl", "delete", network_acl]
+                for network_acl in leftovers["network ACL"]
+            ],
+            None,
+        ),
+        (
+            "network zone",
+            [
+                ["incus", "network", "zone", "delete", network_zone]
+                for network_zone in leftovers["network zone"]
+            ],
+            None,
+        ),
     ):
-        LOG.warning(
-            'The network ACL "simulated-production-acl" was not destroyed properly.'
-        )
-        if force or Confirm.ask("Do you want to destroy it?", default=True):
-            subprocess.run(
-                args=["incus", "network", "acl", "delete", "simulated-production-acl"],
+        if commands:
+            LOG.debug(f"Deleting {len(commands)} leftover {kind}(s)...")
+            delete_leftovers(commands=commands, confirmation=confirmation)
+
+
+def incus_object_names(*object_type: str) -> set[str]:
+    # Only the names are needed: the CSV output starts with the name column and is read
+    # row by row instead of loading every object (with its "used_by" list) from JSON.
+    with subprocess.Popen(
+        args=["incus", *object_type, "list", "--format=csv"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        env=ENV,
+    ) as p:
+        return {
+            row[0].removesuffix(" (current)")
+            for row in csv.reader(p.stdout)  # type: ignore
+            if row
+        }
+
+
+def delete_leftovers(commands: list[list[str]], confirmation: bytes | None) -> None:
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for _ in executor.map(
+            lambda args: subprocess.run(
+                args=args,
                 check=False,
                 capture_output=True,
+                input=confirmation,
                 env=ENV,
-            )
-
-    remove_tracks_from_terraform_modules(
-        tracks=terraform_tracks,
-        remote=remote,
-        production=production,
-    )
-    if total_deployed_tracks == len(terraform_tracks):
-        LOG.info("Successfully destroyed every track")
-    else:
-        LOG.info(
-            f"Successfully destroyed: {', '.join([track.name for track in terraform_tracks])}"
-        )
+            ),
+            commands,
+        ):
+            pass
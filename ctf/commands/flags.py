@@ -1,6 +1,7 @@
 import csv
 import io
 import json
+import os
 from enum import StrEnum
 
 import rich
@@ -10,7 +11,7 @@ from typing_extensions import Annotated
 
 from ctf.common.logger import LOG
 from ctf.common.models import Track
-from ctf.common.utils import find_ctf_root_directory, parse_track_yaml
+from ctf.common.utils import get_challenges_directory, parse_track_yaml
 
 app = typer.Typer()
 
@@ -38,16 +39,13 @@ def flags(
 ) -> None:
     distinct_tracks: set[Track] = set()
 
-    for entry in (
-        challenges_directory := (find_ctf_root_directory() / "challenges")
-    ).iterdir():
-        if (track_directory := challenges_directory / entry).is_dir() and (
-            track_directory / "track.yaml"
-        ).exists():
-            if not tracks:
-                distinct_tracks.add(Track(name=entry.name))
-            elif entry.name in tracks:
-                distinct_tracks.add(Track(name=entry.name))
+    with os.scandir(get_challenges_directory()) as entries:
+        for entry in entries:
+            if entry.is_dir() and os.path.exists(f"{entry.path}/track.yaml"):
+                if not tracks:
+                    distinct_tracks.add(Track(name=entry.name))
+                elif entry.name in tracks:
+                    distinct_tracks.add(Track(name=entry.name))
 
     flags = []
     for track in distinct_tracks:
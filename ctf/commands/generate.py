@@ -1,5 +1,8 @@
 import os
+import stat
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 import typer
 from typing_extensions import Annotated
@@ -11,8 +14,8 @@ from ctf.common.utils import (
     add_tracks_to_terraform_modules,
     create_terraform_modules_file,
     does_track_require_build_container,
-    find_ctf_root_directory,
     get_all_available_tracks,
+    get_deploy_directory,
     get_terraform_tracks_from_modules,
     terraform_binary,
     track_has_virtual_machine,
@@ -79,13 +82,15 @@ def generate(
     ] = [],
 ) -> set[Track]:
     ENV["INCUS_REMOTE"] = remote
-    # Get the list of tracks.
+    # Get the list of tracks. Filter by name first so only the selected tracks get validated.
+    selected_tracks = frozenset(tracks)
+    excluded_tracks = frozenset(exclude_tracks)
     distinct_tracks: set[Track] = set(
         track
         for track in get_all_available_tracks()
-        if validate_track_can_be_deployed(track=track)
-        and (not tracks or track.name in tracks)
-        and track not in exclude_tracks
+        if (not selected_tracks or track.name in selected_tracks)
+        and track.name not in excluded_tracks
+        and validate_track_can_be_deployed(track=track)
     )
 
     if distinct_tracks:
@@ -115,58 +120,27 @@ def generate(
             else distinct_tracks
         )
 
-        for track in distinct_tracks:
-            relpath = os.path.relpath(
-                find_ctf_root_directory() / ".deploy" / "common",
-                (
-                    terraform_directory := (
-                        find_ctf_root_directory()
-                        / "challenges"
-                        / track.name
-                        / "terraform"
-                    )
+        deploy_directory: Path = get_deploy_directory()
+        # Symlinks of different tracks are independent, refresh them concurrently.
+        with ThreadPoolExecutor() as executor:
+            for _ in executor.map(
+                lambda track: refresh_terraform_symlinks(
+                    track=track, common_directory=deploy_directory / "common"
                 ),
-            )
-
-            # If the file exists and is a symlink, refresh it by deleting it first.
-            if (
-                p := (terraform_directory / "variables.tf")
-            ).exists() and p.is_symlink():
-                p.unlink()
-
-                LOG.debug(f"Refreshing symlink {p}.")
-
-            if not p.exists():
-                os.symlink(
-                    src=os.path.join(relpath, "variables.tf"),
-                    dst=p,
-                )
-
-                LOG.debug(f"Created symlink {p}.")
-
-            # If the file exists and is a symlink, refresh it by deleting it first.
-            if (p := (terraform_directory / "versions.tf")).exists() and p.is_symlink():
-                p.unlink()
-
-                LOG.debug(f"Refreshing symlink {p}.")
-
-            if not p.exists():
-                os.symlink(
-                    src=os.path.join(relpath, "versions.tf"),
-                    dst=p,
-                )
-
-                LOG.debug(f"Created symlink {p}.")
+                distinct_tracks,
+            ):
+                pass
 
+        terraform: Path = terraform_binary()
         subprocess.run(
-            args=[terraform_binary(), "init", "-upgrade"],
-            cwd=find_ctf_root_directory() / ".deploy",
+            args=[terraform, "init", "-upgrade"],
+            cwd=deploy_directory,
             stdout=subprocess.DEVNULL,
             check=True,
         )
         subprocess.run(
-            args=[terraform_binary(), "validate"],
-            cwd=find_ctf_root_directory() / ".deploy",
+            args=[terraform, "validate"],
+            cwd=deploy_directory,
             check=True,
         )
     else:
@@ -174,3 +148,34 @@ def generate(
         exit(1)
 
     return distinct_tracks
+
+
+def refresh_terraform_symlinks(track: Track, common_directory: Path) -> None:
+    # Plain string paths: this runs for every track and these are POSIX-only paths.
+    relpath = os.path.relpath(
+        common_directory, (terraform_directory := f"{track.location}/terraform")
+    )
+
+    for file_name in ("variables.tf", "versions.tf"):
+        # A single lstat tells whether the file is missing, a symlink or a regular file.
+        try:
+            mode: int | None = os.lstat(
+                p := f"{terraform_directory}/{file_name}"
+            ).st_mode
+        except FileNotFoundError:
+            mode = None
+
+        # If the file is a symlink, refresh it by deleting it first.
+        if mode is not None and stat.S_ISLNK(mode):
+            os.unlink(p)
+            mode = None
+
+            LOG.debug(f"Refreshing symlink {p}.")
+
+        if mode is None:
+            os.symlink(
+                src=f"{relpath}/{file_name}",
+                dst=p,
+            )
+
+            LOG.debug(f"Created symlink {p}.")
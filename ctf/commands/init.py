@@ -3,7 +3,6 @@ import importlib.resources
 import shutil
 from pathlib import Path
 
-import jinja2
 import typer
 from typing_extensions import Annotated
 
@@ -55,6 +54,8 @@ def init(
             )
             exit(1)
 
+        import jinja2
+
         with importlib.resources.path("ctf.templates", "init") as templates_location:
             jinja_env = jinja2.Environment(
                 loader=jinja2.FileSystemLoader(
@@ -71,7 +72,12 @@ def init(
                     LOG.info(f'Created "{dst_asset}" file')
                 elif asset.is_dir():
                     dst_asset = path / asset.name
-                    shutil.copytree(asset, dst_asset, dirs_exist_ok=True)
+                    shutil.copytree(
+                        asset,
+                        dst_asset,
+                        copy_function=shutil.copy,
+                        dirs_exist_ok=True,
+                    )
                     LOG.info(f'Created "{dst_asset}" folder')
                 else:
                     dst_asset = path / asset.name
@@ -1,12 +1,15 @@
+import os
 from enum import StrEnum
 
 import rich
 import typer
-from rich.table import Table
 from typing_extensions import Annotated
 
-from ctf.common.models import Track
-from ctf.common.utils import find_ctf_root_directory, parse_post_yamls, parse_track_yaml
+from ctf.common.utils import (
+    get_challenges_directory,
+    parse_post_yamls,
+    parse_track_yaml,
+)
 
 app = typer.Typer()
 
@@ -21,44 +24,48 @@ def list_tracks(
         ListOutputFormat, typer.Option("--format", "-f", help="Output format")
     ] = ListOutputFormat.PRETTY,
 ) -> None:
-    tracks: set[Track] = set()
-    for track in (find_ctf_root_directory() / "challenges").iterdir():
-        if (find_ctf_root_directory() / "challenges" / track).is_dir() and (
-            find_ctf_root_directory() / "challenges" / track / "track.yaml"
-        ).exists():
-            tracks.add(Track(name=track.name))
-
-    parsed_tracks = []
-    for track in tracks:
-        parsed_track = parse_track_yaml(track.name)
-
-        # find the discourse topic name
-        posts = parse_post_yamls(track.name)
-        topic = None
-        for post in posts:
-            if post.get("type") == "topic":
-                topic = post["title"]
-        parsed_tracks.append(
-            [
-                parsed_track["name"],
-                topic,
-                ", ".join(parsed_track["contacts"]["dev"]),
-                ", ".join(parsed_track["contacts"]["support"]),
-                ", ".join(parsed_track["contacts"]["qa"]),
-            ]
-        )
-
-    if format.value == "pretty":
-        table = Table(title="Tracks")
-        table.add_column("Internal track name", style="cyan")
-        table.add_column("Discourse topic name", style="magenta")
-        table.add_column("Dev")
-        table.add_column("Support")
-        table.add_column("QA")
-
-        for parsed_track in sorted(parsed_tracks, key=lambda x: x[0].lower()):
-            table.add_row(*parsed_track)
-
-        rich.print(table)
-    else:
-        raise ValueError(f"Invalid format: {format.value}")
+    # Directory names are already unique, no need for Track objects to deduplicate them.
+    tracks: list[str] = []
+    with os.scandir(get_challenges_directory()) as entries:
+        for entry in entries:
+            if entry.is_dir() and os.path.exists(f"{entry.path}/track.yaml"):
+                tracks.append(entry.name)
+
+    parsed_tracks = sorted(map(parse_track_row, tracks), key=lambda x: x[0].lower())
+
+    # Typer only accepts the values of ListOutputFormat, and pretty is the only one.
+    from rich.table import Table
+
+    table = Table(title="Tracks")
+    table.add_column("Internal track name", style="cyan")
+    table.add_column("Discourse topic name", style="magenta")
+    table.add_column("Dev")
+    table.add_column("Support")
+    table.add_column("QA")
+
+    for parsed_track in parsed_tracks:
+        table.add_row(*parsed_track)
+
+    rich.print(table)
+
+
+def parse_track_row(track_name: str) -> list[str | None]:
+    parsed_track = parse_track_yaml(track_name)
+
+    # find the discourse topic name
+    topic = next(
+        (
+            post["title"]
+            for post in parse_post_yamls(track_name)
+            if post.get("type") == "topic"
+        ),
+        None,
+    )
+
+    return [
+        parsed_track["name"],
+        topic,
+        ", ".join(parsed_track["contacts"]["dev"]),
+        ", ".join(parsed_track["contacts"]["support"]),
+        ", ".join(parsed_track["contacts"]["qa"]),
+    ]
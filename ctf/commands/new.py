@@ -1,17 +1,20 @@
 import importlib.resources
 import os
-import re
 import secrets
 import shutil
 from enum import StrEnum
 from pathlib import Path
+from typing import TYPE_CHECKING, Any
 
-import jinja2
 import typer
 from typing_extensions import Annotated
 
 from ctf.common.logger import LOG
-from ctf.common.utils import find_ctf_root_directory
+from ctf.common.models import INCUS_NAME_RE
+from ctf.common.utils import get_challenges_directory, get_deploy_directory
+
+if TYPE_CHECKING:
+    import jinja2
 
 app = typer.Typer()
 
@@ -68,7 +71,7 @@ def new(
     ] = False,
 ) -> None:
     LOG.info(f"Creating a new track: {name}")
-    if not re.match(pattern=r"^[a-z][a-z0-9\-]{0,61}[a-z0-9]$", string=name):
+    if not INCUS_NAME_RE.match(name):
         LOG.critical(
             """The track name Valid instance names must fulfill the following requirements:
 * The name must be between 1 and 63 characters long;
@@ -81,100 +84,84 @@ def new(
     if template == Template.RUST_WEBSERVICE:
         with_build_container = True
 
-    if (
-        new_challenge_directory := find_ctf_root_directory() / "challenges" / name
-    ).exists():
-        if force:
-            LOG.debug(f"Deleting {new_challenge_directory}")
+    new_challenge_directory = get_challenges_directory() / name
+    if force:
+        LOG.debug(f"Deleting {new_challenge_directory}")
+        try:
             shutil.rmtree(new_challenge_directory)
-        else:
-            LOG.critical(
-                "Track already exists with that name. Use `--force` to overwrite the track."
-            )
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            LOG.critical(f"Could not delete {new_challenge_directory}: {e}")
             exit(1)
 
-    new_challenge_directory.mkdir()
+    try:
+        new_challenge_directory.mkdir()
+    except FileExistsError:
+        LOG.critical(
+            "Track already exists with that name. Use `--force` to overwrite the track."
+        )
+        exit(1)
 
     LOG.debug(f"Directory {new_challenge_directory} created.")
 
+    import jinja2
+
     with importlib.resources.path("ctf.templates", "new") as templates_location:
         env = jinja2.Environment(
             loader=jinja2.FileSystemLoader(
                 searchpath=templates_location, encoding="utf-8"
-            )
+            ),
+            # Keep the compiled templates between runs in a per-user temporary directory.
+            bytecode_cache=jinja2.FileSystemBytecodeCache(),
+            auto_reload=False,
         )
 
-        ipv6_subnet = f"9000:d37e:c40b:{secrets.choice('0123456789abcdef')}{secrets.choice('0123456789abcdef')}{secrets.choice('0123456789abcdef')}{secrets.choice('0123456789abcdef')}"
-
-        rb = [
-            secrets.choice("0123456789abcdef"),
-            secrets.choice("0123456789abcdef"),
-            secrets.choice("0123456789abcdef"),
-            secrets.choice("0123456789abcdef"),
-            secrets.choice("0123456789abcdef"),
-            secrets.choice("0123456789abcdef"),
-            secrets.choice("0123456789abcdef"),
-            secrets.choice("0123456789abcdef"),
-            secrets.choice("0123456789abcdef"),
-            secrets.choice("0123456789abcdef"),
-            secrets.choice("0123456789abcdef"),
-            secrets.choice("0123456789abcdef"),
-        ]
-        hardware_address = f"00:16:3e:{rb[0]}{rb[1]}:{rb[2]}{rb[3]}:{rb[4]}{rb[5]}"
-        ipv6_address = f"216:3eff:fe{rb[0]}{rb[1]}:{rb[2]}{rb[3]}{rb[4]}{rb[5]}"
-        full_ipv6_address = f"{ipv6_subnet}:{ipv6_address}"
-
-        track_template = env.get_template(os.path.join("common", "track.yaml.j2"))
-        render = track_template.render(
-            data={
-                "name": name,
-                "full_ipv6_address": full_ipv6_address,
-                "hardware_address": hardware_address,
-                "is_windows": template == Template.WINDOWS_VM,
-                "template": template.value,
-                "with_build": with_build_container,
-                "with_virtual_machine": with_virtual_machine,
-            }
-        )
-        with (p := new_challenge_directory / "track.yaml").open(
-            mode="w", encoding="utf-8"
-        ) as f:
-            f.write(render)
+        ipv6_subnet = f"9000:d37e:c40b:{secrets.token_hex(2)}"
 
-        LOG.debug(f"Wrote {p}.")
-
-        readme_template = env.get_template(name=os.path.join("common", "README.md.j2"))
-        render = readme_template.render(data={"name": name})
-        with (p := new_challenge_directory / "README.md").open(
-            mode="w", encoding="utf-8"
-        ) as f:
-            f.write(render)
-
-        LOG.debug(f"Wrote {p}.")
+        rb = secrets.token_hex(3)
+        hardware_address = f"00:16:3e:{rb[0:2]}:{rb[2:4]}:{rb[4:6]}"
+        ipv6_address = f"216:3eff:fe{rb[0:2]}:{rb[2:6]}"
+        full_ipv6_address = f"{ipv6_subnet}:{ipv6_address}"
 
         posts_directory: Path = new_challenge_directory / "posts"
         posts_directory.mkdir()
 
         LOG.debug(f"Directory {posts_directory} created.")
 
-        track_template = env.get_template(name=os.path.join("common", "topic.yaml.j2"))
-        render = track_template.render(data={"name": name})
-        with (p := posts_directory / f"{name}.yaml").open(
-            mode="w", encoding="utf-8"
-        ) as f:
-            f.write(render)
-
-        LOG.debug(f"Wrote {p}.")
-
-        track_template = env.get_template(name=os.path.join("common", "post.yaml.j2"))
-        render = track_template.render(data={"name": name})
-        with (p := posts_directory / f"{name}_flag1.yaml").open(
-            mode="w",
-            encoding="utf-8",
-        ) as f:
-            f.write(render)
-
-        LOG.debug(f"Wrote {p}.")
+        render_templates(
+            env=env,
+            templates=[
+                (
+                    "common/track.yaml.j2",
+                    new_challenge_directory / "track.yaml",
+                    {
+                        "name": name,
+                        "full_ipv6_address": full_ipv6_address,
+                        "hardware_address": hardware_address,
+                        "is_windows": template == Template.WINDOWS_VM,
+                        "template": template.value,
+                        "with_build": with_build_container,
+                        "with_virtual_machine": with_virtual_machine,
+                    },
+                ),
+                (
+                    "common/README.md.j2",
+                    new_challenge_directory / "README.md",
+                    {"name": name},
+                ),
+                (
+                    "common/topic.yaml.j2",
+                    posts_directory / f"{name}.yaml",
+                    {"name": name},
+                ),
+                (
+                    "common/post.yaml.j2",
+                    posts_directory / f"{name}_flag1.yaml",
+                    {"name": name},
+                ),
+            ],
+        )
 
         if template == Template.TRACK_YAML_ONLY:
             return
@@ -192,130 +179,110 @@ def new(
 
         LOG.debug(f"Directory {terraform_directory} created.")
 
-        track_template = env.get_template(name=os.path.join("common", "main.tf.j2"))
-
-        render = track_template.render(
-            data={
-                "name": name,
-                "ipv6_subnet": ipv6_subnet,
-                "full_ipv6_address": full_ipv6_address,
-                "with_build": with_build_container,
-                "with_virtual_machine": with_virtual_machine,
-                "is_windows": template == Template.WINDOWS_VM,
-            }
-        )
-        with (p := terraform_directory / "main.tf").open(
-            mode="w", encoding="utf-8"
-        ) as f:
-            f.write(render)
-
-        LOG.debug(f"Wrote {p}.")
-
         relpath = os.path.relpath(
-            find_ctf_root_directory() / ".deploy" / "common", terraform_directory
+            get_deploy_directory() / "common", terraform_directory
         )
 
-        os.symlink(
-            src=os.path.join(relpath, "variables.tf"),
-            dst=(p := terraform_directory / "variables.tf"),
-        )
-
-        LOG.debug(f"Wrote {p}.")
-
-        os.symlink(
-            src=os.path.join(relpath, "versions.tf"),
-            dst=(p := terraform_directory / "versions.tf"),
-        )
+        for file_name in ("variables.tf", "versions.tf"):
+            os.symlink(
+                src=os.path.join(relpath, file_name),
+                dst=(p := terraform_directory / file_name),
+            )
 
-        LOG.debug(f"Wrote {p}.")
+            LOG.debug(f"Wrote {p}.")
 
         ansible_directory: Path = new_challenge_directory / "ansible"
-        ansible_directory.mkdir()
+        ansible_challenge_directory: Path = ansible_directory / "challenge"
+        ansible_challenge_directory.mkdir(parents=True)
 
-        LOG.debug(f"Directory {ansible_directory} created.")
+        LOG.debug(f"Directory {ansible_challenge_directory} created.")
 
-        track_template = env.get_template(name=os.path.join(template, "deploy.yaml.j2"))
-        render = track_template.render(
-            data={
-                "name": name,
-                "with_build": with_build_container,
-                "with_virtual_machine": with_virtual_machine,
-            }
-        )
-        with (p := ansible_directory / "deploy.yaml").open(
-            mode="w", encoding="utf-8"
-        ) as f:
-            f.write(render)
+        if template == Template.RUST_WEBSERVICE:
+            # Copy the entire challenge template
+            shutil.copytree(
+                templates_location / Template.RUST_WEBSERVICE / "source",
+                ansible_challenge_directory,
+                dirs_exist_ok=True,
+            )
+            LOG.debug(f"Wrote files to {ansible_challenge_directory}")
 
-        LOG.debug(f"Wrote {p}.")
+        templates: list[tuple[str | list[str], Path, dict[str, Any]]] = [
+            (
+                "common/main.tf.j2",
+                terraform_directory / "main.tf",
+                {
+                    "name": name,
+                    "ipv6_subnet": ipv6_subnet,
+                    "full_ipv6_address": full_ipv6_address,
+                    "with_build": with_build_container,
+                    "with_virtual_machine": with_virtual_machine,
+                    "is_windows": template == Template.WINDOWS_VM,
+                },
+            ),
+            (
+                f"{template}/deploy.yaml.j2",
+                ansible_directory / "deploy.yaml",
+                {
+                    "name": name,
+                    "with_build": with_build_container,
+                    "with_virtual_machine": with_virtual_machine,
+                },
+            ),
+            (
+                "common/inventory.j2",
+                ansible_directory / "inventory",
+                {
+                    "name": name,
+                    "with_build": with_build_container,
+                    "with_virtual_machine": with_virtual_machine,
+                    "is_windows": template == Template.WINDOWS_VM,
+                },
+            ),
+        ]
 
         if with_build_container:
-            try:
-                track_template = env.get_template(
-                    os.path.join(template, "build.yaml.j2")
+            templates.append(
+                (
+                    # Use the template specific build playbook if there is one.
+                    [
+                        f"{template}/build.yaml.j2",
+                        "common/build.yaml.j2",
+                    ],
+                    ansible_directory / "build.yaml",
+                    {"name": name, "with_build": with_build_container},
                 )
-            except jinja2.TemplateNotFound:
-                track_template = env.get_template(
-                    os.path.join("common", "build.yaml.j2")
-                )
-
-            render = track_template.render(
-                data={"name": name, "with_build": with_build_container}
             )
 
-            with (p := ansible_directory / "build.yaml").open(
-                mode="w", encoding="utf-8"
-            ) as f:
-                f.write(render)
-            LOG.debug(f"Wrote {p}.")
-
-        track_template = env.get_template(name=os.path.join("common", "inventory.j2"))
-        render = track_template.render(
-            data={
-                "name": name,
-                "with_build": with_build_container,
-                "with_virtual_machine": with_virtual_machine,
-                "is_windows": template == Template.WINDOWS_VM,
-            }
-        )
-        with (p := ansible_directory / "inventory").open(
-            mode="w", encoding="utf-8"
-        ) as f:
-            f.write(render)
-
-        LOG.debug(f"Wrote {p}.")
-
-        ansible_challenge_directory: Path = ansible_directory / "challenge"
-        ansible_challenge_directory.mkdir()
-
-        LOG.debug(f"Directory {ansible_challenge_directory} created.")
-
         if template == Template.APACHE_PHP:
-            track_template = env.get_template(
-                os.path.join(Template.APACHE_PHP, "index.php.j2")
+            templates.append(
+                (
+                    f"{Template.APACHE_PHP}/index.php.j2",
+                    ansible_challenge_directory / "index.php",
+                    {"name": name},
+                )
             )
-            render = track_template.render(data={"name": name})
-            with (p := ansible_challenge_directory / "index.php").open(
-                mode="w",
-                encoding="utf-8",
-            ) as f:
-                f.write(render)
-
-            LOG.debug(f"Wrote {p}.")
 
         if template == Template.PYTHON_SERVICE:
-            track_template = env.get_template(
-                os.path.join(Template.PYTHON_SERVICE, "app.py.j2")
+            templates.append(
+                (
+                    f"{Template.PYTHON_SERVICE}/app.py.j2",
+                    ansible_challenge_directory / "app.py",
+                    {"name": name},
+                )
             )
-            render = track_template.render(data={"name": name})
-            with (p := ansible_challenge_directory / "app.py").open(
-                mode="w",
-                encoding="utf-8",
-            ) as f:
-                f.write(render)
 
-            LOG.debug(f"Wrote {p}.")
+        if template == Template.RUST_WEBSERVICE:
+            templates.append(
+                (
+                    f"{Template.RUST_WEBSERVICE}/Cargo.toml.j2",
+                    ansible_challenge_directory / "Cargo.toml",
+                    {"name": name},
+                )
+            )
+
+        render_templates(env=env, templates=templates)
 
+        if template == Template.PYTHON_SERVICE:
             with (p := ansible_challenge_directory / "flag-1.txt").open(
                 mode="w",
                 encoding="utf-8",
@@ -324,23 +291,14 @@ def new(
 
             LOG.debug(f"Wrote {p}.")
 
-        if template == Template.RUST_WEBSERVICE:
-            # Copy the entire challenge template
-            shutil.copytree(
-                templates_location / Template.RUST_WEBSERVICE / "source",
-                ansible_challenge_directory,
-                dirs_exist_ok=True,
-            )
-            LOG.debug(f"Wrote files to {ansible_challenge_directory}")
 
-            manifest_template = env.get_template(
-                os.path.join(Template.RUST_WEBSERVICE, "Cargo.toml.j2")
-            )
-            render = manifest_template.render(data={"name": name})
-            with (p := ansible_challenge_directory / "Cargo.toml").open(
-                mode="w",
-                encoding="utf-8",
-            ) as f:
-                f.write(render)
+def render_templates(
+    env: "jinja2.Environment",
+    templates: list[tuple[str | list[str], Path, dict[str, Any]]],
+) -> None:
+    # Each entry is (template name or names to try in order, destination, data).
+    for template_name, destination, data in templates:
+        render = env.get_or_select_template(template_name).render(data=data)
+        destination.write_bytes(render.encode(encoding="utf-8"))
 
-            LOG.debug(f"Wrote {p}.")
+        LOG.debug(f"Wrote {destination}.")
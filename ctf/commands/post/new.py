@@ -47,10 +47,8 @@ __API_USERS: list[str] = []
 def _get_api_users_from_schema(lowercase: bool = False) -> list[str]:
     global __API_USERS
     if not __API_USERS:
-        __API_USERS = json.load(
-            (get_ctf_script_schemas_directory() / "post.json").open(
-                mode="r", encoding="utf-8"
-            )
+        __API_USERS = json.loads(
+            (get_ctf_script_schemas_directory() / "post.json").read_bytes()
         )["properties"]["api"]["properties"]["user"]["enum"]
 
     if lowercase:
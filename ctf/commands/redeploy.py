@@ -2,8 +2,6 @@ import typer
 from typing_extensions import Annotated
 
 from ctf import ENV
-from ctf.commands.deploy import deploy
-from ctf.commands.destroy import destroy
 
 app = typer.Typer()
 
@@ -87,6 +85,9 @@ def redeploy(
         ),
     ] = [],
 ) -> None:
+    from ctf.commands.deploy import deploy
+    from ctf.commands.destroy import destroy
+
     ENV["INCUS_REMOTE"] = remote
     destroy(
         tracks=tracks,
@@ -1,12 +1,12 @@
+import os
 import socket
 
-import requests
 import rich
 import typer
 from typing_extensions import Annotated
 
 from ctf.common.logger import LOG
-from ctf.common.utils import find_ctf_root_directory, parse_track_yaml
+from ctf.common.utils import get_challenges_directory, parse_track_yaml
 
 app = typer.Typer()
 
@@ -26,16 +26,13 @@ def services(
     ] = False,
 ) -> None:
     distinct_tracks: set[str] = set()
-    for entry in (
-        challenges_directory := (find_ctf_root_directory() / "challenges")
-    ).iterdir():
-        if (track_directory := (challenges_directory / entry)).is_dir() and (
-            track_directory / "track.yaml"
-        ).exists():
-            if not tracks:
-                distinct_tracks.add(entry.name)
-            elif entry.name in tracks:
-                distinct_tracks.add(entry.name)
+    with os.scandir(get_challenges_directory()) as entries:
+        for entry in entries:
+            if entry.is_dir() and os.path.exists(f"{entry.path}/track.yaml"):
+                if not tracks:
+                    distinct_tracks.add(entry.name)
+                elif entry.name in tracks:
+                    distinct_tracks.add(entry.name)
 
     all_services = []
 
@@ -69,6 +66,8 @@ def services(
         all_services += services
 
     if check:
+        import requests
+
         LOG.info("Checking services...")
         for service in all_services:
             name = service["name"]
@@ -1,31 +1,24 @@
+import collections
 import json
 import logging
 import os
 import statistics
 import subprocess
-import tempfile
 from datetime import datetime
+from pathlib import Path
+from typing import Any
 
 import rich
 import typer
+import yaml
 from typing_extensions import Annotated
 
 from ctf.common.logger import LOG
-from ctf.common.utils import find_ctf_root_directory, parse_track_yaml
-
-try:
-    import pybadges
-
-    _has_pybadges = True
-except ImportError:
-    _has_pybadges = False
-
-try:
-    import matplotlib.pyplot as plt
-
-    _has_matplotlib = True
-except ImportError:
-    _has_matplotlib = False
+from ctf.common.utils import (
+    YamlLoader,
+    get_challenges_directory,
+    load_yaml_file_cached,
+)
 
 app = typer.Typer()
 
@@ -65,169 +58,48 @@ def stats(
     ] = False,
 ) -> None:
     LOG.debug("Generating statistics...")
-    stats = {}
-    distinct_tracks: set[str] = set()
-    for entry in (
-        challenges_directory := (find_ctf_root_directory() / "challenges")
-    ).iterdir():
-        if (track_directory := (challenges_directory / entry)).is_dir() and (
-            track_directory / "track.yaml"
-        ).is_file():
-            if not tracks:
-                distinct_tracks.add(entry.name)
-            elif entry in tracks:
-                distinct_tracks.add(entry.name)
-
-    stats["number_of_tracks"] = len(distinct_tracks)
-    stats["number_of_tracks_integrated_with_scenario"] = 0
-    stats["number_of_flags"] = 0
-    stats["highest_value_flag"] = 0
-    stats["most_flags_in_a_track"] = 0
-    stats["total_flags_value"] = 0
-    stats["number_of_services"] = 0
-    stats["number_of_files"] = 0
-    stats["median_flag_value"] = 0
-    stats["mean_flag_value"] = 0
-    stats["number_of_services_per_port"] = {}
-    stats["flag_count_per_value"] = {}
-    stats["number_of_challenge_designers"] = 0
-    stats["number_of_flags_per_track"] = {}
-    stats["number_of_points_per_track"] = {}
-    stats["not_integrated_with_scenario"] = []
-    stats["qa_not_done"] = []
-    challenge_designers = set()
-    flags = []
-    for track in distinct_tracks:
-        track_yaml = parse_track_yaml(track_name=track)
-        number_of_flags = len(track_yaml["flags"])
-        stats["number_of_flags_per_track"][track] = number_of_flags
-        if track_yaml["integrated_with_scenario"]:
-            stats["number_of_tracks_integrated_with_scenario"] += 1
-        else:
-            stats["not_integrated_with_scenario"].append(track)
-        if number_of_flags > stats["most_flags_in_a_track"]:
-            stats["most_flags_in_a_track"] = number_of_flags
-        stats["number_of_flags"] += number_of_flags
-        instances = track_yaml.get("instances", {}).values()
-        services = track_yaml.get("services", []) + [
-            service
-            for instance in instances
-            for service in instance.get("services", [])
-        ]
-        stats["number_of_services"] += len(services)
-        stats["number_of_points_per_track"][track] = 0
-        for flag in track_yaml["flags"]:
-            flags.append(flag["value"])
-            stats["number_of_points_per_track"][track] += flag["value"]
-            stats["total_flags_value"] += flag["value"]
-            if flag["value"] > stats["highest_value_flag"]:
-                stats["highest_value_flag"] = flag["value"]
-            if flag["value"] not in stats["flag_count_per_value"]:
-                stats["flag_count_per_value"][flag["value"]] = 0
-            stats["flag_count_per_value"][flag["value"]] += 1
-        for service in services:
-            if service["port"] not in stats["number_of_services_per_port"]:
-                stats["number_of_services_per_port"][service["port"]] = 0
-            stats["number_of_services_per_port"][service["port"]] += 1
-        track_designers = set()
-        for challenge_designer in track_yaml["contacts"]["dev"]:
-            challenge_designers.add(challenge_designer.lower())
-            track_designers.add(challenge_designer)
-        qa = set()
-        for qa_member in track_yaml["contacts"].get("qa", []):
-            qa.add(qa_member.lower())
-        if not qa - track_designers:
-            stats["qa_not_done"].append(track)
-
-        if (files_directory := (challenges_directory / track / "files")).exists():
-            for _ in files_directory.iterdir():
-                stats["number_of_files"] += 1
-    stats["median_flag_value"] = statistics.median(flags)
-    stats["mean_flag_value"] = round(statistics.mean(flags), 2)
-    stats["number_of_challenge_designers"] = len(challenge_designers)
-
-    # Sort dict keys
-    stats["flag_count_per_value"] = {
-        key: stats["flag_count_per_value"][key]
-        for key in sorted(stats["flag_count_per_value"].keys())
-    }
-    stats["number_of_services_per_port"] = {
-        key: stats["number_of_services_per_port"][key]
-        for key in sorted(stats["number_of_services_per_port"].keys())
-    }
-
-    stats["challenge_designers"] = sorted(list(challenge_designers))
-    stats["number_of_flags_per_track"] = dict(
-        sorted(stats["number_of_flags_per_track"].items(), key=lambda item: item[1])
-    )
-    stats["number_of_points_per_track"] = dict(
-        sorted(stats["number_of_points_per_track"].items(), key=lambda item: item[1])
+    stats = compute_stats(
+        challenges_directory=get_challenges_directory(), tracks=tracks
     )
 
     rich.print(json.dumps(stats, indent=2, ensure_ascii=False))
     if generate_badges:
-        if not _has_pybadges:
+        try:
+            import pybadges
+        except ImportError:
             LOG.critical("Module pybadges was not found.")
             exit(1)
         LOG.info("Generating badges...")
         os.makedirs(name=".badges", exist_ok=True)
-        write_badge(
-            "flag",
-            pybadges.badge(left_text="Flags", right_text=str(stats["number_of_flags"])),  # type: ignore
-        )
-        write_badge(
-            "points",
-            pybadges.badge(  # type: ignore
-                left_text="Points", right_text=str(stats["total_flags_value"])
-            ),
-        )
-        write_badge(
-            "tracks",
-            pybadges.badge(  # type: ignore
-                left_text="Tracks", right_text=str(stats["number_of_tracks"])
-            ),
-        )
-        write_badge(
-            "services",
-            pybadges.badge(  # type: ignore
-                left_text="Services", right_text=str(stats["number_of_services"])
-            ),
-        )
-        write_badge(
-            "designers",
-            pybadges.badge(  # type: ignore
-                left_text="Challenge Designers",
-                right_text=str(stats["number_of_challenge_designers"]),
+        badges = {
+            "flag": ("Flags", str(stats["number_of_flags"])),
+            "points": ("Points", str(stats["total_flags_value"])),
+            "tracks": ("Tracks", str(stats["number_of_tracks"])),
+            "services": ("Services", str(stats["number_of_services"])),
+            "designers": (
+                "Challenge Designers",
+                str(stats["number_of_challenge_designers"]),
             ),
-        )
-        write_badge(
-            "files",
-            pybadges.badge(  # type: ignore
-                left_text="Files",
-                right_text=str(stats["number_of_files"]),
+            "files": ("Files", str(stats["number_of_files"])),
+            "scenario": (
+                "Integrated with scenario",
+                f"{stats['number_of_tracks_integrated_with_scenario']}/{stats['number_of_tracks']}",
             ),
-        )
-        write_badge(
-            "scenario",
-            pybadges.badge(  # type: ignore
-                left_text="Integrated with scenario",
-                right_text=str(stats["number_of_tracks_integrated_with_scenario"])
-                + "/"
-                + str(stats["number_of_tracks"]),
+            "qa_done": (
+                "QA Done",
+                f"{stats['number_of_tracks'] - len(stats['qa_not_done'])}/{stats['number_of_tracks']}",
             ),
-        )
-        write_badge(
-            "qa_done",
-            pybadges.badge(  # type: ignore
-                left_text="QA Done",
-                right_text=str(stats["number_of_tracks"] - len(stats["qa_not_done"]))
-                + "/"
-                + str(stats["number_of_tracks"]),
-            ),
-        )
+        }
+        for name, (left_text, right_text) in badges.items():
+            write_badge(
+                name,
+                pybadges.badge(left_text=left_text, right_text=right_text),  # type: ignore
+            )
 
     if charts:
-        if not _has_matplotlib:
+        try:
+            from matplotlib.figure import Figure
+        except ImportError:
             LOG.critical("Module matplotlib was not found.")
             exit(1)
         LOG.info("Generating charts...")
@@ -236,7 +108,8 @@ def stats(
         os.makedirs(name=".charts", exist_ok=True)
         # Flag count per value barchart
 
-        fig, ax1 = plt.subplots()
+        fig = Figure()
+        ax1 = fig.subplots()
         width = 0.3
 
         number_of_points = []
@@ -269,50 +142,54 @@ def stats(
         ax2.set_ylabel("Number of points", color="orange")
         ax2.tick_params(axis="y", labelcolor="orange")
 
-        plt.xticks(
-            ticks=range(0, max(stats["flag_count_per_value"].keys()) + 1), rotation=45
-        )
+        ax2.set_xticks(ticks=range(0, max(stats["flag_count_per_value"].keys()) + 1))
+        ax2.tick_params(axis="x", labelrotation=45)
 
-        plt.grid(True, linestyle="--", alpha=0.3)
-        plt.xlabel("Flag Value")
-        plt.title("Number of Flags per Value")
+        ax2.grid(True, linestyle="--", alpha=0.3)
+        ax2.set_xlabel("Flag Value")
+        ax2.set_title("Number of Flags per Value")
         fig.legend(loc="upper right")
 
-        plt.savefig(os.path.join(".charts", "flags_per_value.png"))
-        plt.clf()
+        fig.savefig(os.path.join(".charts", "flags_per_value.png"))
 
         # Number of flag per track barchart
-        plt.bar(
+        fig = Figure()
+        ax = fig.subplots()
+        ax.bar(
             list(stats["number_of_flags_per_track"].keys()),
             stats["number_of_flags_per_track"].values(),
         )
-        plt.xticks(ticks=list(stats["number_of_flags_per_track"].keys()), rotation=90)
-        plt.grid(True, linestyle="--", alpha=0.3)
-        plt.subplots_adjust(bottom=0.5)
-        plt.xlabel("Track")
-        plt.ylabel("Number of flags")
-        plt.title("Number of flags per track")
-        plt.savefig(os.path.join(".charts", "flags_per_track.png"))
-        plt.clf()
+        ax.set_xticks(ticks=list(stats["number_of_flags_per_track"].keys()))
+        ax.tick_params(axis="x", labelrotation=90)
+        ax.grid(True, linestyle="--", alpha=0.3)
+        fig.subplots_adjust(bottom=0.5)
+        ax.set_xlabel("Track")
+        ax.set_ylabel("Number of flags")
+        ax.set_title("Number of flags per track")
+        fig.savefig(os.path.join(".charts", "flags_per_track.png"))
 
         # Number of points per track barchart
-        plt.bar(
+        fig = Figure()
+        ax = fig.subplots()
+        ax.bar(
             list(stats["number_of_points_per_track"].keys()),
             stats["number_of_points_per_track"].values(),
         )
-        plt.xticks(ticks=list(stats["number_of_points_per_track"].keys()), rotation=90)
-        plt.grid(True, linestyle="--", alpha=0.3)
-        plt.subplots_adjust(bottom=0.5)
-        plt.xlabel("Track")
-        plt.ylabel("Number of points")
-        plt.title("Number of points per track")
-        plt.savefig(os.path.join(".charts", "points_per_track.png"))
-        plt.clf()
+        ax.set_xticks(ticks=list(stats["number_of_points_per_track"].keys()))
+        ax.tick_params(axis="x", labelrotation=90)
+        ax.grid(True, linestyle="--", alpha=0.3)
+        fig.subplots_adjust(bottom=0.5)
+        ax.set_xlabel("Track")
+        ax.set_ylabel("Number of points")
+        ax.set_title("Number of points per track")
+        fig.savefig(os.path.join(".charts", "points_per_track.png"))
 
         if historical:
-            with rich.progress.Progress(
+            from rich.progress import BarColumn, Progress
+
+            with Progress(
                 "[progress.description]{task.description}",
-                rich.progress.BarColumn(),
+                BarColumn(),
                 "[progress.percentage]{task.percentage:>3.0f}%",
                 "({task.completed}/{task.total} commits)",
                 transient=True,
@@ -320,9 +197,17 @@ def stats(
                 LOG.info("Collecting commits...")
                 # Number of points and flags over time
                 historical_data = {}
+                # Let git keep only the commits with "Merge pull request" in their message.
                 commit_list = (
                     subprocess.check_output(
-                        ["git", "log", "--pretty=format:%H %ad", "--date=iso"]
+                        [
+                            "git",
+                            "log",
+                            "--fixed-strings",
+                            "--grep=Merge pull request",
+                            "--pretty=format:%H %ad",
+                            "--date=iso",
+                        ]
                     )
                     .decode()
                     .splitlines()[::-1]
@@ -339,60 +224,35 @@ def stats(
                     description="Processing commits...",
                     total=len(commit_list_with_date),
                 )
-                with tempfile.TemporaryDirectory(prefix="ctf-historical-") as tmpdir:
-                    worktree_path = os.path.join(tmpdir, "worktree")
-                    subprocess.run(
-                        ["git", "worktree", "add", "--detach", worktree_path],
-                        check=True,
-                        capture_output=True,
-                    )
-                    try:
-                        for i, commit in list(enumerate(commit_list_with_date))[0:]:
-                            parsed_datetime, hash = commit
-                            # Check if the commit message has "Merge pull request" in it
-                            commit_message = subprocess.run(
-                                ["git", "show", "-s", "--pretty=%B", hash],
-                                check=True,
-                                capture_output=True,
-                            )
-                            if "Merge pull request" in commit_message.stdout.decode():
-                                LOG.debug(
-                                    f"{i + 1}/{len(commit_list_with_date)} Checking out commit: {commit}"
-                                )
-                                parsed_date = parsed_datetime.date()
-                                subprocess.run(
-                                    ["git", "-C", worktree_path, "checkout", hash],
-                                    check=True,
-                                    capture_output=True,
-                                )
-                                result = (
-                                    subprocess.run(
-                                        ["ctf", "--no-update-check", "stats"],
-                                        check=False,
-                                        capture_output=True,
-                                        text=True,
-                                        cwd=worktree_path,
-                                    ),
-                                )
-                                if result[0].returncode == 0:
-                                    stats = json.loads(result[0].stdout)
-                                    total_points = stats["total_flags_value"]
-                                    total_flags = stats["number_of_flags"]
-                                    historical_data[parsed_date] = {
-                                        "total_points": total_points,
-                                        "total_flags": total_flags,
-                                    }
-                                else:
-                                    LOG.warning(
-                                        f"Failed to get stats for commit {hash} ({parsed_date}). Error: {result[0].stderr[:100]}"
-                                    )
-                            progress.update(task, advance=1)
-                    finally:
-                        subprocess.run(
-                            ["git", "worktree", "remove", "--force", worktree_path],
-                            check=False,
-                            capture_output=True,
+                # Read the track.yaml files straight from the object store instead of
+                # checking out every commit, one cat-file process serves all the blobs.
+                with subprocess.Popen(
+                    ["git", "cat-file", "--batch"],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                ) as cat_file:
+                    for i, commit in enumerate(commit_list_with_date):
+                        parsed_datetime, hash = commit
+                        LOG.debug(
+                            f"{i + 1}/{len(commit_list_with_date)} Reading commit: {commit}"
                         )
+                        parsed_date = parsed_datetime.date()
+                        try:
+                            commit_stats = compute_stats_from_track_yamls(
+                                *load_track_yamls_from_commit(
+                                    commit=hash, cat_file=cat_file
+                                )
+                            )
+                        except Exception as e:
+                            LOG.warning(
+                                f"Failed to get stats for commit {hash} ({parsed_date}). Error: {str(e)[:100]}"
+                            )
+                        else:
+                            historical_data[parsed_date] = {
+                                "total_points": commit_stats["total_flags_value"],
+                                "total_flags": commit_stats["number_of_flags"],
+                            }
+                        progress.update(task, advance=1)
 
                 all_dates = list(historical_data.keys())
                 all_points = [data["total_points"] for data in historical_data.values()]
@@ -402,27 +262,169 @@ def stats(
                     sorted(set(list(range(0, n, step)) + [n - 1])) if n else []
                 )
 
-                plt.plot(all_dates, all_points, label="Total Points")
-                plt.grid(True, linestyle="--", alpha=0.3)
-                plt.subplots_adjust(bottom=0.1)
-                plt.xlabel("Time")
-                plt.ylabel("Total points")
-                plt.title("Total points over time")
-                plt.xticks(
+                fig = Figure()
+                ax = fig.subplots()
+                ax.plot(all_dates, all_points, label="Total Points")
+                ax.grid(True, linestyle="--", alpha=0.3)
+                ax.set_xlabel("Time")
+                ax.set_ylabel("Total points")
+                ax.set_title("Total points over time")
+                ax.set_xticks(
                     ticks=[all_dates[i] for i in label_indices],
                     labels=[str(all_dates[i]) for i in label_indices],
                     rotation=90,
                 )
-                plt.subplots_adjust(bottom=0.2)
-                plt.subplot().set_ylim(0, max(all_points) + 10 if all_points else 10)
-                plt.savefig(os.path.join(".charts", "points_over_time.png"))
-                plt.clf()
+                fig.subplots_adjust(bottom=0.2)
+                ax.set_ylim(0, max(all_points) + 10 if all_points else 10)
+                fig.savefig(os.path.join(".charts", "points_over_time.png"))
 
     LOG.debug("Done...")
 
 
+def compute_stats(challenges_directory: Path, tracks: list[str]) -> dict[str, Any]:
+    distinct_tracks: set[str] = set()
+    with os.scandir(challenges_directory) as entries:
+        for entry in entries:
+            if entry.is_dir() and os.path.isfile(f"{entry.path}/track.yaml"):
+                if not tracks:
+                    distinct_tracks.add(entry.name)
+                elif entry.name in tracks:
+                    distinct_tracks.add(entry.name)
+
+    track_yamls = {
+        track: load_yaml_file_cached(challenges_directory / track / "track.yaml")
+        for track in distinct_tracks
+    }
+
+    number_of_files = 0
+    for track in distinct_tracks:
+        # Counting the entries does not need any stat, not even to check the directory.
+        try:
+            with os.scandir(challenges_directory / track / "files") as files:
+                number_of_files += sum(1 for _ in files)
+        except FileNotFoundError:
+            pass
+
+    return compute_stats_from_track_yamls(
+        track_yamls=track_yamls, number_of_files=number_of_files
+    )
+
+
+def load_track_yamls_from_commit(
+    commit: str, cat_file: subprocess.Popen[bytes]
+) -> tuple[dict[str, Any], int]:
+    """Return the parsed track.yaml of every track in a commit along with the number of
+    entries in their files directories, as `compute_stats` would find them in a checkout.
+
+    `cat_file` is a running `git cat-file --batch` process.
+    """
+    tracks: list[str] = []
+    files: set[tuple[str, str]] = set()
+    for path in (
+        subprocess.check_output(
+            ["git", "ls-tree", "-r", "-z", "--full-tree", "--name-only", commit]
+            + ["--", "challenges/"]
+        )
+        .decode()
+        .split("\0")
+    ):
+        match path.split("/"):
+            case ["challenges", track, "track.yaml"]:
+                tracks.append(track)
+            case ["challenges", track, "files", name, *_]:
+                files.add((track, name))
+
+    track_yamls: dict[str, Any] = {}
+    for track in tracks:
+        request = f"{commit}:challenges/{track}/track.yaml\n"
+        cat_file.stdin.write(request.encode())  # type: ignore
+        cat_file.stdin.flush()  # type: ignore
+        # The header is "<oid> <type> <size>" and the content is followed by a newline.
+        size = int(cat_file.stdout.readline().split()[2])  # type: ignore
+        content = cat_file.stdout.read(size + 1)  # type: ignore
+        track_yamls[track] = yaml.load(content, Loader=YamlLoader)
+
+    return track_yamls, sum(1 for track, _ in files if track in track_yamls)
+
+
+def compute_stats_from_track_yamls(
+    track_yamls: dict[str, Any], number_of_files: int
+) -> dict[str, Any]:
+    stats: dict[str, Any] = {}
+    stats["number_of_tracks"] = len(track_yamls)
+    stats["number_of_tracks_integrated_with_scenario"] = 0
+    stats["number_of_flags"] = 0
+    stats["highest_value_flag"] = 0
+    stats["most_flags_in_a_track"] = 0
+    stats["total_flags_value"] = 0
+    stats["number_of_services"] = 0
+    stats["number_of_files"] = number_of_files
+    stats["median_flag_value"] = 0
+    stats["mean_flag_value"] = 0
+    stats["number_of_services_per_port"] = {}
+    stats["flag_count_per_value"] = {}
+    stats["number_of_challenge_designers"] = 0
+    stats["number_of_flags_per_track"] = {}
+    stats["number_of_points_per_track"] = {}
+    stats["not_integrated_with_scenario"] = []
+    stats["qa_not_done"] = []
+    challenge_designers = set()
+    flags = []
+    flag_count_per_value: collections.Counter[int] = collections.Counter()
+    services_per_port: collections.Counter[int] = collections.Counter()
+    for track, track_yaml in track_yamls.items():
+        number_of_flags = len(track_yaml["flags"])
+        stats["number_of_flags_per_track"][track] = number_of_flags
+        if track_yaml["integrated_with_scenario"]:
+            stats["number_of_tracks_integrated_with_scenario"] += 1
+        else:
+            stats["not_integrated_with_scenario"].append(track)
+        if number_of_flags > stats["most_flags_in_a_track"]:
+            stats["most_flags_in_a_track"] = number_of_flags
+        stats["number_of_flags"] += number_of_flags
+        instances = track_yaml.get("instances", {}).values()
+        services = track_yaml.get("services", []) + [
+            service
+            for instance in instances
+            for service in instance.get("services", [])
+        ]
+        stats["number_of_services"] += len(services)
+        flag_values = [flag["value"] for flag in track_yaml["flags"]]
+        flags.extend(flag_values)
+        stats["number_of_points_per_track"][track] = sum(flag_values)
+        stats["total_flags_value"] += stats["number_of_points_per_track"][track]
+        stats["highest_value_flag"] = max(
+            stats["highest_value_flag"], max(flag_values, default=0)
+        )
+        flag_count_per_value.update(flag_values)
+        services_per_port.update(service["port"] for service in services)
+        track_designers = set()
+        for challenge_designer in track_yaml["contacts"]["dev"]:
+            challenge_designers.add(challenge_designer.lower())
+            track_designers.add(challenge_designer)
+        qa = set()
+        for qa_member in track_yaml["contacts"].get("qa", []):
+            qa.add(qa_member.lower())
+        if not qa - track_designers:
+            stats["qa_not_done"].append(track)
+    stats["median_flag_value"] = statistics.median(flags)
+    stats["mean_flag_value"] = round(stats["total_flags_value"] / len(flags), 2)
+    stats["number_of_challenge_designers"] = len(challenge_designers)
+
+    # Sort dict keys
+    stats["flag_count_per_value"] = dict(sorted(flag_count_per_value.items()))
+    stats["number_of_services_per_port"] = dict(sorted(services_per_port.items()))
+
+    stats["challenge_designers"] = sorted(list(challenge_designers))
+    stats["number_of_flags_per_track"] = dict(
+        sorted(stats["number_of_flags_per_track"].items(), key=lambda item: item[1])
+    )
+    stats["number_of_points_per_track"] = dict(
+        sorted(stats["number_of_points_per_track"].items(), key=lambda item: item[1])
+    )
+
+    return stats
+
+
 def write_badge(name: str, svg: str) -> None:
-    with open(
-        os.path.join(".badges", f"badge-{name}.svg"), mode="w", encoding="utf-8"
-    ) as f:
-        f.write(svg)
+    Path(".badges", f"badge-{name}.svg").write_text(svg, encoding="utf-8")
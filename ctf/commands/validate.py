@@ -1,3 +1,4 @@
+import os
 import re
 import subprocess
 import textwrap
@@ -15,6 +16,7 @@ from rich.progress import (
 from ctf.common.logger import LOG
 from ctf.common.utils import (
     find_ctf_root_directory,
+    get_challenges_directory,
     get_ctf_script_schemas_directory,
     load_ctf_config,
 )
@@ -23,6 +25,8 @@ from ctf.validate_json_schemas import validate_with_json_schemas
 
 app = typer.Typer()
 
+FAILED_TO_READ_FILE_RE = re.compile(r"(Failed to read file .+)$", re.MULTILINE)
+
 
 @app.command(
     help="Run many static validations to ensure coherence and quality in the tracks and repo as a whole."
@@ -42,12 +46,13 @@ def validate() -> None:
 
     validators = [validator_class() for validator_class in active_validators]
 
+    challenges_directory = get_challenges_directory()
+
     tracks = []
-    for track in (find_ctf_root_directory() / "challenges").iterdir():
-        if (find_ctf_root_directory() / "challenges" / track).is_dir() and (
-            find_ctf_root_directory() / "challenges" / track / "track.yaml"
-        ).exists():
-            tracks.append(track.name)
+    with os.scandir(challenges_directory) as entries:
+        for entry in entries:
+            if entry.is_dir() and os.path.exists(f"{entry.path}/track.yaml"):
+                tracks.append(entry.name)
 
     LOG.info(f"Found {len(tracks)} tracks")
 
@@ -56,16 +61,12 @@ def validate() -> None:
     LOG.debug("Validating track.yaml files against JSON Schema...")
     validate_with_json_schemas(
         schema=get_ctf_script_schemas_directory() / "track.yaml.json",
-        files_pattern=str(
-            find_ctf_root_directory() / "challenges" / "*" / "track.yaml"
-        ),
+        files_pattern=str(challenges_directory / "*" / "track.yaml"),
     )
     LOG.debug("Validating discourse post YAML files against JSON Schema...")
     validate_with_json_schemas(
         schema=get_ctf_script_schemas_directory() / "post.json",
-        files_pattern=str(
-            find_ctf_root_directory() / "challenges" / "*" / "posts" / "*.yaml"
-        ),
+        files_pattern=str(challenges_directory / "*" / "posts" / "*.yaml"),
     )
 
     LOG.info("Validating terraform files format...")
@@ -89,11 +90,7 @@ def validate() -> None:
                     "Files": "\n".join(
                         [
                             *([out] if (out := r.stdout.decode().strip()) else []),
-                            *re.findall(
-                                pattern=r"(Failed to read file .+)$",
-                                string=r.stderr.decode().strip(),
-                                flags=re.MULTILINE,
-                            ),
+                            *FAILED_TO_READ_FILE_RE.findall(r.stderr.decode().strip()),
                         ]
                     )
                 },
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import re
 from enum import StrEnum
 from typing import Annotated, Any, Literal
 
@@ -11,7 +12,9 @@ from pydantic import (
     StringConstraints,
 )
 
-IncusStr = Annotated[str, StringConstraints(pattern=r"^[a-z][a-z0-9\-]{0,61}[a-z0-9]$")]
+INCUS_NAME_RE = re.compile(r"^[a-z][a-z0-9\-]{0,61}[a-z0-9]$")
+
+IncusStr = Annotated[str, StringConstraints(pattern=INCUS_NAME_RE.pattern)]
 PortNumber = Annotated[int, Field(ge=1, le=65535)]
 CheckType = Literal["http", "https", "ssh", "tcp"]
 
@@ -29,9 +32,9 @@ class Track(BaseModel):
 
     @property
     def location(self):
-        from ctf.common.utils import find_ctf_root_directory
+        from ctf.common.utils import get_challenges_directory
 
-        return find_ctf_root_directory() / "challenges" / self.name
+        return get_challenges_directory() / self.name
 
     def __eq__(self, other: Any) -> bool:
         match other:
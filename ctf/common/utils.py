@@ -1,13 +1,14 @@
+import functools
 import importlib.metadata
 import os
+import pickle
 import re
 import shutil
 import subprocess
 import textwrap
 from pathlib import Path
-from typing import Any, Generator
+from typing import TYPE_CHECKING, Any, Generator
 
-import jinja2
 import typer
 import yaml
 
@@ -15,7 +16,15 @@ from ctf import ENV
 from ctf.common.logger import LOG
 from ctf.common.models import CtfConfig, Track, TrackYaml
 
-__CTF_ROOT_DIRECTORY: Path | None = None
+if TYPE_CHECKING:
+    import jinja2
+
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+    LOG.debug("PyYAML was built without libyaml, using the slower pure Python loader.")
 
 
 def available_incus_remotes() -> list[str]:
@@ -23,11 +32,12 @@ def available_incus_remotes() -> list[str]:
         r = subprocess.run(
             args=["incus", "remote", "list", "-fcsv", "-cn"],
             capture_output=True,
+            text=True,
         )
     except FileNotFoundError:
         return []
 
-    return r.stdout.decode().strip().replace(" (current)", "").splitlines()
+    return r.stdout.strip().replace(" (current)", "").splitlines()
 
 
 def check_git_lfs() -> bool:
@@ -35,27 +45,15 @@ def check_git_lfs() -> bool:
 
 
 def get_all_available_tracks() -> set[Track]:
-    tracks = set()
-
-    for entry in (
-        challenges_directory := (find_ctf_root_directory() / "challenges")
-    ).iterdir():
-        if not (challenges_directory / entry).is_dir():
-            continue
-
-        tracks.add(Track(name=entry.name))
-
-    return tracks
+    # DirEntry.is_dir() uses the file type from readdir, only symlinks need a stat.
+    with os.scandir(get_challenges_directory()) as entries:
+        return {Track(name=entry.name) for entry in entries if entry.is_dir()}
 
 
 def does_track_require_build_container(track: Track) -> bool:
     return (
         build_yaml_file_path := (
-            find_ctf_root_directory()
-            / "challenges"
-            / track.name
-            / "ansible"
-            / "build.yaml"
+            get_challenges_directory() / track.name / "ansible" / "build.yaml"
         )
     ).is_file() and bool(load_yaml_file(build_yaml_file_path))
 
@@ -65,8 +63,7 @@ def track_has_virtual_machine(track: str | Track) -> bool:
         parse_track_yaml(track_name=track.name if isinstance(track, Track) else track)
     )
     with (
-        find_ctf_root_directory()
-        / "challenges"
+        get_challenges_directory()
         / (track.name if isinstance(track, Track) else track)
         / "terraform"
         / "main.tf"
@@ -87,109 +84,119 @@ def track_has_virtual_machine(track: str | Track) -> bool:
 
 
 def validate_track_can_be_deployed(track: Track) -> bool:
+    # A stat per required file is cheaper than listing both directories, and the
+    # checks stop at the first missing file.
+    track_directory = track.location
     return (
-        (
-            find_ctf_root_directory()
-            / "challenges"
-            / track.name
-            / "terraform"
-            / "main.tf"
-        ).exists()
-        and (
-            find_ctf_root_directory()
-            / "challenges"
-            / track.name
-            / "ansible"
-            / "deploy.yaml"
-        ).exists()
-        and (
-            find_ctf_root_directory()
-            / "challenges"
-            / track.name
-            / "ansible"
-            / "inventory"
-        ).exists()
+        (track_directory / "terraform" / "main.tf").exists()
+        and (track_directory / "ansible" / "deploy.yaml").exists()
+        and (track_directory / "ansible" / "inventory").exists()
+    )
+
+
+TRACK_MODULES_TEMPLATE = textwrap.dedent(
+    text="""\
+    {% for track in tracks %}
+    module "track-{{ track.name }}" {
+      source = "../challenges/{{ track.name }}/terraform"
+      build_container = {{ 'true' if track.require_build_container else 'false' }}
+      already_deployed = {{ 'true' if track.already_deployed else 'false' }}
+      {% if track.production %}deploy = "production"{% endif %}
+      {% if track.remote %}incus_remote = "{{ track.remote }}"{% endif %}
+      {% if track.vm_remote %}incus_vm_remote = "{{ track.vm_remote }}"{% endif %}
+      {% if track.vm_project %}incus_vm_project = "{{ track.vm_project }}"{% endif %}
+      {% for ov in output_variables %}
+      {{ ov }} = module.common.{{ ov }}
+      {% endfor %}
+    }
+    {% endfor %}
+    """
+)
+
+COMMON_MODULE_TEMPLATE = textwrap.dedent(
+    text="""\
+    module "common" {
+      source = "./common"
+      {% if production %}deploy = "production"{% endif %}
+      {% if remote %}incus_remote = "{{ remote }}"{% endif %}
+    }
+
+    """
+)
+
+TERRAFORM_VARIABLE_TEMPLATE = textwrap.dedent(
+    text="""\
+    variable "{{variable}}" {
+        default = "{{default}}"
+        type    = {{type}}
+    }
+    """
+)
+
+
+@functools.cache
+def get_jinja_environment() -> "jinja2.Environment":
+    import jinja2
+
+    return jinja2.Environment()
+
+
+@functools.cache
+def get_jinja_template(source: str) -> "jinja2.Template":
+    return get_jinja_environment().from_string(source=source)
+
+
+def render_tracks_terraform_modules(tracks: set[Track]) -> str:
+    return get_jinja_template(source=TRACK_MODULES_TEMPLATE).render(
+        tracks=tracks,
+        output_variables=get_common_modules_output_variables(),
+    )
+
+
+def render_common_terraform_module(remote: str, production: bool = False) -> str:
+    return get_jinja_template(source=COMMON_MODULE_TEMPLATE).render(
+        production=production,
+        remote=remote,
     )
 
 
 def add_tracks_to_terraform_modules(tracks: set[Track]):
-    with (find_ctf_root_directory() / ".deploy" / "modules.tf").open(mode="a") as fd:
-        template = jinja2.Environment().from_string(
-            source=textwrap.dedent(
-                text="""\
-                    {% for track in tracks %}
-                    module "track-{{ track.name }}" {
-                      source = "../challenges/{{ track.name }}/terraform"
-                      build_container = {{ 'true' if track.require_build_container else 'false' }}
-                      already_deployed = {{ 'true' if track.already_deployed else 'false' }}
-                      {% if track.production %}deploy = "production"{% endif %}
-                      {% if track.remote %}incus_remote = "{{ track.remote }}"{% endif %}
-                      {% if track.vm_remote %}incus_vm_remote = "{{ track.vm_remote }}"{% endif %}
-                      {% if track.vm_project %}incus_vm_project = "{{ track.vm_project }}"{% endif %}
-                      {% for ov in output_variables %}
-                      {{ ov }} = module.common.{{ ov }}
-                      {% endfor %}
-                    }
-                    {% endfor %}
-                    """
-            )
-        )
-        fd.write(
-            template.render(
-                tracks=tracks - get_terraform_tracks_from_modules(),
-                output_variables=get_common_modules_output_variables(),
-            )
-        )
+    # An empty set renders nothing, no need to parse modules.tf for it.
+    if not tracks:
+        return
+
+    with (get_deploy_directory() / "modules.tf").open(mode="a") as fd:
+        if tracks := tracks - get_terraform_tracks_from_modules():
+            fd.write(render_tracks_terraform_modules(tracks=tracks))
 
 
 def create_terraform_modules_file(
     remote: str,
     production: bool = False,
 ) -> None:
-    with (find_ctf_root_directory() / ".deploy" / "modules.tf").open(mode="w+") as fd:
-        template = jinja2.Environment().from_string(
-            source=textwrap.dedent(
-                text="""\
-                    module "common" {
-                      source = "./common"
-                      {% if production %}deploy = "production"{% endif %}
-                      {% if remote %}incus_remote = "{{ remote }}"{% endif %}
-                    }
-
-                    """
-            )
-        )
-        fd.write(
-            template.render(
-                production=production,
-                remote=remote,
-            )
-        )
+    (get_deploy_directory() / "modules.tf").write_text(
+        render_common_terraform_module(remote=remote, production=production)
+    )
+
+
+OUTPUT_VARIABLE_RE = re.compile(r'^output\s*"([a-zA-Z_\-]+)"\s*{', re.MULTILINE)
+VARIABLE_RE = re.compile(r'^variable\s*"([a-zA-Z_\-]+)"\s*{', re.MULTILINE)
 
 
 def get_common_modules_output_variables() -> set[str]:
     output_variables: set[str] = set()
-    output_variable_regex: re.Pattern = re.compile(
-        r'^output\s*"([a-zA-Z_\-]+)"\s*{', re.MULTILINE
-    )
-    variable_regex: re.Pattern = re.compile(
-        r'^variable\s*"([a-zA-Z_\-]+)"\s*{', re.MULTILINE
-    )
 
     variables: set[str] = set()
 
-    for file in (find_ctf_root_directory() / ".deploy" / "common").iterdir():
+    for file in (get_deploy_directory() / "common").iterdir():
         if file.name == "versions.tf":
             continue
 
-        with file.open(mode="r") as f:
-            match file.name:
-                case "variables.tf":
-                    for i in variable_regex.findall(f.read()):
-                        variables.add(i)
-                case _:
-                    for i in output_variable_regex.findall(f.read()):
-                        output_variables.add(i)
+        match file.name:
+            case "variables.tf":
+                variables.update(VARIABLE_RE.findall(file.read_text()))
+            case _:
+                output_variables.update(OUTPUT_VARIABLE_RE.findall(file.read_text()))
 
     for variable in output_variables - variables:
         LOG.error(
@@ -210,20 +217,11 @@ def get_common_modules_output_variables() -> set[str]:
 
             var_type = input("What is the type? [string] ") or "string"
 
-            with (
-                find_ctf_root_directory() / ".deploy" / "common" / "variables.tf"
-            ).open(mode="a") as f:
+            with (get_deploy_directory() / "common" / "variables.tf").open(
+                mode="a"
+            ) as f:
                 f.write("\n")
-                template = jinja2.Environment().from_string(
-                    source=textwrap.dedent(
-                        text="""\
-                        variable "{{variable}}" {
-                            default = "{{default}}"
-                            type    = {{type}}
-                        }
-                        """
-                    )
-                )
+                template = get_jinja_template(source=TERRAFORM_VARIABLE_TEMPLATE)
                 f.write(
                     template.render(variable=variable, default=default, type=var_type)
                 )
@@ -245,19 +243,22 @@ def get_common_modules_output_variables() -> set[str]:
     return output_variables & variables
 
 
-def get_terraform_tracks_from_modules() -> set[Track]:
-    with (find_ctf_root_directory() / ".deploy" / "modules.tf").open(mode="r") as f:
-        modules_tf = f.read()
+# A single pass over each modules.tf line, the matched group tells which setting it is.
+MODULES_TF_LINE_RE = re.compile(
+    r"^(?:"
+    r"module \"track-(?P<name>[a-z][a-z0-9\-]{0,61}[a-z0-9])\"\s*\{"
+    r"|deploy\s*=\s*\"(?P<production>production)\""
+    r"|incus_remote\s*=\s*\"(?P<remote>[^\"]+)\""
+    r"|incus_vm_remote\s*=\s*\"(?P<vm_remote>[^\"]+)\""
+    r"|incus_vm_project\s*=\s*\"(?P<vm_project>[^\"]+)\""
+    r"|build_container\s*=\s*(?P<build_container>true)"
+    r"|already_deployed\s*=\s*(?P<already_deployed>true)"
+    r")$"
+)
 
-    module_line_regex = re.compile(
-        r"^module \"track-([a-z][a-z0-9\-]{0,61}[a-z0-9])\"\s*\{$"
-    )
-    production_line_regex = re.compile(r"^deploy\s*=\s*\"production\"$")
-    remote_line_regex = re.compile(r"^incus_remote\s*=\s*\"([^\"]+)\"$")
-    vm_remote_line_regex = re.compile(r"^incus_vm_remote\s*=\s*\"([^\"]+)\"$")
-    vm_project_line_regex = re.compile(r"^incus_vm_project\s*=\s*\"([^\"]+)\"$")
-    build_container_line_regex = re.compile(r"^build_container\s*=\s*true$")
-    already_deployed_line_regex = re.compile(r"^already_deployed\s*=\s*true$")
+
+def get_terraform_tracks_from_modules() -> set[Track]:
+    modules_tf = (get_deploy_directory() / "modules.tf").read_text()
 
     tracks: set[Track] = set()
     name: str = ""
@@ -294,26 +295,24 @@ def get_terraform_tracks_from_modules() -> set[Track]:
             already_deployed = False
             continue
 
-        if m := module_line_regex.match(line):
-            name = m.group(1)
-
-        if production_line_regex.match(line):
-            production = True
-
-        if m := remote_line_regex.match(line):
-            remote = m.group(1)
-
-        if m := vm_remote_line_regex.match(line):
-            vm_remote = m.group(1)
-
-        if m := vm_project_line_regex.match(line):
-            vm_project = m.group(1)
-
-        if build_container_line_regex.match(line):
-            require_build_container = True
+        if not (m := MODULES_TF_LINE_RE.match(line)):
+            continue
 
-        if already_deployed_line_regex.match(line):
-            already_deployed = True
+        match m.lastgroup:
+            case "name":
+                name = m["name"]
+            case "production":
+                production = True
+            case "remote":
+                remote = m["remote"]
+            case "vm_remote":
+                vm_remote = m["vm_remote"]
+            case "vm_project":
+                vm_project = m["vm_project"]
+            case "build_container":
+                require_build_container = True
+            case "already_deployed":
+                already_deployed = True
 
     return tracks
 
@@ -324,19 +323,39 @@ def remove_tracks_from_terraform_modules(
     *,
     production: bool = False,
 ):
-    current_tracks = get_terraform_tracks_from_modules()
-
-    create_terraform_modules_file(remote=remote, production=production)
-    add_tracks_to_terraform_modules(tracks=(current_tracks - tracks))
+    remaining_tracks = get_terraform_tracks_from_modules() - tracks
+
+    # Render the whole file and write it once instead of truncating it and appending.
+    (get_deploy_directory() / "modules.tf").write_text(
+        render_common_terraform_module(remote=remote, production=production)
+        + (
+            render_tracks_terraform_modules(tracks=remaining_tracks)
+            if remaining_tracks
+            else ""
+        )
+    )
 
 
 def get_all_file_paths_recursively(path: Path) -> Generator[Path, None, None]:
     if path.is_file():
         yield remove_ctf_script_root_directory_from_path(path=path)
-    else:
-        for file in path.iterdir():
-            for f in get_all_file_paths_recursively(file):
-                yield f
+        return
+
+    # A stack of directory iterators keeps the same order as recursing, without yielding
+    # every file through one generator per level. DirEntry.is_file() uses the file type
+    # from readdir, anything that is not a file is walked as a directory.
+    stack = [os.scandir(path)]
+    try:
+        while stack:
+            if (entry := next(stack[-1], None)) is None:
+                stack.pop().close()
+            elif entry.is_file():
+                yield remove_ctf_script_root_directory_from_path(path=Path(entry.path))
+            else:
+                stack.append(os.scandir(entry.path))
+    finally:
+        for entries in stack:
+            entries.close()
 
 
 def get_ctf_script_schemas_directory() -> Path:
@@ -344,16 +363,36 @@ def get_ctf_script_schemas_directory() -> Path:
 
 
 def remove_ctf_script_root_directory_from_path(path: Path) -> Path:
+    # Paths are almost always built from the root directory, so stripping the prefix
+    # avoids os.path.relpath normalizing and splitting both paths on every call. Only
+    # paths with ".." components still need relpath to be normalized.
+    root = f"{find_ctf_root_directory()}{os.sep}"
+    if (path_str := str(path)).startswith(root) and ".." not in path.parts:
+        return Path(path_str.removeprefix(root))
+
     return Path(os.path.relpath(path, find_ctf_root_directory()))
 
 
 def load_yaml_file(file: Path) -> dict[str, Any]:
-    return yaml.safe_load(file.open(mode="r", encoding="utf-8"))
+    # Hand the raw bytes to the loader, it decodes UTF-8 itself in a single pass.
+    return yaml.load(file.read_bytes(), Loader=YamlLoader)
+
+
+@functools.cache
+def _load_yaml_file_cached(file: Path, mtime_ns: int) -> bytes:
+    # The modification time is part of the cache key so an edited file is parsed again.
+    # The document is kept pickled, unpickling is a much cheaper deep copy.
+    return pickle.dumps(load_yaml_file(file), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_yaml_file_cached(file: Path) -> Any:
+    # Callers are free to modify what they get, so they each get their own copy.
+    return pickle.loads(_load_yaml_file_cached(file, file.stat().st_mtime_ns))
 
 
 def parse_track_yaml(track_name: str) -> dict[str, Any]:
-    r = load_yaml_file(
-        p := (find_ctf_root_directory() / "challenges" / track_name / "track.yaml")
+    r = load_yaml_file_cached(
+        p := (get_challenges_directory() / track_name / "track.yaml")
     )
     r["file_location"] = remove_ctf_script_root_directory_from_path(path=p)
 
@@ -361,25 +400,28 @@ def parse_track_yaml(track_name: str) -> dict[str, Any]:
 
 
 def parse_post_yamls(track_name: str) -> list[dict]:
+    posts_dir = get_challenges_directory() / track_name / "posts"
+    try:
+        with os.scandir(posts_dir) as entries:
+            post_files = [
+                Path(entry.path)
+                for entry in entries
+                if entry.name.endswith((".yml", ".yaml")) and entry.is_file()
+            ]
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+
     posts = []
-    for post in (
-        posts_dir := (find_ctf_root_directory() / "challenges" / track_name / "posts")
-    ).iterdir():
-        if post.name.endswith(".yml") or post.name.endswith(".yaml"):
-            r = load_yaml_file(posts_dir / post)
-            r["file_location"] = remove_ctf_script_root_directory_from_path(
-                path=posts_dir
-            )
-            posts.append(r)
+    for post_file in post_files:
+        r = load_yaml_file_cached(post_file)
+        r["file_location"] = remove_ctf_script_root_directory_from_path(path=posts_dir)
+        posts.append(r)
 
     return posts
 
 
+@functools.cache
 def find_ctf_root_directory() -> Path:
-    global __CTF_ROOT_DIRECTORY
-    if __CTF_ROOT_DIRECTORY:
-        return __CTF_ROOT_DIRECTORY
-
     path: Path = (Path(ENV.get("CTF_ROOT_DIR", "."))).expanduser().resolve()
     while not is_ctf_dir(path) and path != (path := (path / "..").resolve()):
         ...
@@ -391,17 +433,22 @@ def find_ctf_root_directory() -> Path:
         exit(1)
 
     LOG.debug(f"Found root directory: {path}")
-    return (__CTF_ROOT_DIRECTORY := path)
+    return path
+
+
+@functools.cache
+def get_challenges_directory() -> Path:
+    return find_ctf_root_directory() / "challenges"
+
+
+@functools.cache
+def get_deploy_directory() -> Path:
+    return find_ctf_root_directory() / ".deploy"
 
 
 def is_ctf_dir(path: Path):
-    ctf_dir = True
-    dir = [p.name for p in path.iterdir()]
-    if ".deploy" not in dir:
-        ctf_dir = False
-    if "challenges" not in dir:
-        ctf_dir = False
-    return ctf_dir
+    # Look up the two entries directly instead of listing every parent directory.
+    return (path / ".deploy").exists() and (path / "challenges").exists()
 
 
 def get_version() -> str:
@@ -423,6 +470,7 @@ def load_ctf_config():
     return CtfConfig.model_validate(load_yaml_file(config_path) or {})
 
 
+@functools.cache
 def terraform_binary() -> Path:
     path = shutil.which(cmd="tofu")
     if not path:
@@ -6,8 +6,8 @@ from pathlib import Path
 
 from ctf.common.models import CtfConfig, ScoringSystem, TrackYaml, ValidationError
 from ctf.common.utils import (
-    find_ctf_root_directory,
     get_all_file_paths_recursively,
+    get_challenges_directory,
     parse_post_yamls,
     parse_track_yaml,
     remove_ctf_script_root_directory_from_path,
@@ -34,9 +34,7 @@ class FilesValidator(Validator):
         self.files_mapping = {}
 
     def validate(self, track_name: str) -> list[ValidationError]:
-        if (
-            path := (find_ctf_root_directory() / "challenges" / track_name / "files")
-        ).exists():
+        if (path := (get_challenges_directory() / track_name / "files")).exists():
             for file in get_all_file_paths_recursively(path=path):
                 # Lower the file name to avoid human error
                 file = os.path.relpath(path=file, start=path).lower()
@@ -128,14 +126,7 @@ class FireworksAskGodTagValidator(Validator):
     def finalize(self) -> list[ValidationError]:
         errors: list[ValidationError] = []
 
-        sound_path = (
-            find_ctf_root_directory()
-            / "challenges"
-            / "*"
-            / "files"
-            / "askgod"
-            / "sounds"
-        )
+        sound_path = get_challenges_directory() / "*" / "files" / "askgod" / "sounds"
         for sound_tag, track_names in self.sound_tags_mapping.items():
             if len(glob.glob(pathname=str(sound_path / sound_tag))) == 0:
                 errors.append(
@@ -149,9 +140,7 @@ class FireworksAskGodTagValidator(Validator):
                     )
                 )
 
-        gif_path: Path = (
-            find_ctf_root_directory() / "challenges" / "*" / "files" / "askgod" / "gifs"
-        )
+        gif_path: Path = get_challenges_directory() / "*" / "files" / "askgod" / "gifs"
         for gif_tag, track_names in self.gif_tags_mapping.items():
             if len(glob.glob(pathname=str(gif_path / gif_tag))) == 0:
                 errors.append(
@@ -199,8 +188,7 @@ class DiscoursePostsAskGodTagValidator(Validator):
             if discourse_post.get("type", "") == "post":
                 self.discourse_posts.append((track_name, discourse_post))
                 if not (
-                    find_ctf_root_directory()
-                    / "challenges"
+                    get_challenges_directory()
                     / track_name
                     / "posts"
                     / str(discourse_post["topic"] + ".yaml")
@@ -213,10 +201,7 @@ class DiscoursePostsAskGodTagValidator(Validator):
                             details={
                                 "Topic": discourse_post["topic"],
                                 "Posts directory": str(
-                                    find_ctf_root_directory()
-                                    / "challenges"
-                                    / track_name
-                                    / "posts"
+                                    get_challenges_directory() / track_name / "posts"
                                 ),
                             },
                         )
@@ -272,49 +257,27 @@ class PlaceholderValuesValidator(Validator):
 
         # Checking placeholders in terraform/main.tf
         if (
-            path := (
-                find_ctf_root_directory()
-                / "challenges"
-                / track_name
-                / "terraform"
-                / "main.tf"
-            )
+            path := (get_challenges_directory() / track_name / "terraform" / "main.tf")
         ).exists():
             files += [path]
 
         # Checking placeholders in track.yml
-        if (
-            path := (
-                find_ctf_root_directory() / "challenges" / track_name / "track.yaml"
-            )
-        ).exists():
+        if (path := (get_challenges_directory() / track_name / "track.yaml")).exists():
             files += [path]
 
         # Checking placeholders in ansible/inventory
         if (
-            path := (
-                find_ctf_root_directory()
-                / "challenges"
-                / track_name
-                / "ansible"
-                / "inventory"
-            )
+            path := (get_challenges_directory() / track_name / "ansible" / "inventory")
         ).exists():
             files += [path]
         # Checking placeholders in posts/*.yaml
         if (
             integrated_with_scenario
-            and (
-                path := (
-                    find_ctf_root_directory() / "challenges" / track_name / "posts"
-                )
-            ).exists()
+            and (path := (get_challenges_directory() / track_name / "posts")).exists()
         ):
             files += list(glob.glob(pathname=str(path / "*.yaml")))
         # Checking placeholders in ansible/*.yaml
-        if (
-            path := (find_ctf_root_directory() / "challenges" / track_name / "ansible")
-        ).exists():
+        if (path := (get_challenges_directory() / track_name / "ansible")).exists():
             files += list(glob.glob(pathname=str(path / "*.yaml")))
 
         for file in files:
@@ -356,9 +319,7 @@ class DiscourseFileNamesValidator(Validator):
         files = []
 
         # Checking placeholders in posts/*.yaml
-        if (
-            path := (find_ctf_root_directory() / "challenges" / track_name / "posts")
-        ).exists():
+        if (path := (get_challenges_directory() / track_name / "posts")).exists():
             files += list(glob.glob(pathname=str(path / "*.yaml")))
 
         for file in files:
@@ -448,9 +409,7 @@ class OrphanServicesValidator(Validator):
                     services.append(service.name)
 
         if services:
-            if not (
-                find_ctf_root_directory() / "challenges" / track_name / "terraform"
-            ).exists():
+            if not (get_challenges_directory() / track_name / "terraform").exists():
                 errors.append(
                     ValidationError(
                         error_name="Orphan service",
@@ -547,10 +506,7 @@ class HasAtLeastOneDiscoursePostValidator(Validator):
                     track_name=track_name,
                     details={
                         "Posts directory": str(
-                            find_ctf_root_directory()
-                            / "challenges"
-                            / track_name
-                            / "posts"
+                            get_challenges_directory() / track_name / "posts"
                         )
                     },
                 )
@@ -569,11 +525,14 @@ class TrailingSpacesForPostUser(Validator):
         errors: list[ValidationError] = []
         discourse_posts: list[dict[str, str]] = []
 
-        for post in (
-            posts_dir := (
-                find_ctf_root_directory() / "challenges" / track_name / "posts"
-            )
-        ).iterdir():
+        posts_dir = get_challenges_directory() / track_name / "posts"
+        try:
+            posts = list(posts_dir.iterdir())
+        except (FileNotFoundError, NotADirectoryError):
+            # A track without posts is reported by HasAtLeastOneDiscoursePostValidator.
+            return errors
+
+        for post in posts:
             if post.name.endswith(".yml") or post.name.endswith(".yaml"):
                 with (posts_dir / post).open(mode="r", encoding="utf-8") as f:
                     discourse_posts.append(
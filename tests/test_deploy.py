@@ -0,0 +1,39 @@
+from ctf.commands.deploy import container_name_for_address
+from ctf.common.models import Track
+
+IPV6_TO_CONTAINER_NAME = {"9000:d37e:c40b:c9f9:216:3eff:fe12:3456": "mock-container"}
+
+
+def test_container_name_for_address_canonicalizes_the_address():
+    assert (
+        container_name_for_address(
+            track=Track(name="mock-track"),
+            address="9000:d37e:c40b:c9f9:0216:3eff:fe12:3456",
+            ipv6_to_container_name=IPV6_TO_CONTAINER_NAME,
+        )
+        == "mock-container"
+    )
+
+
+def test_container_name_for_address_skips_missing_addresses():
+    assert (
+        container_name_for_address(
+            track=Track(name="mock-track"),
+            address=None,
+            ipv6_to_container_name=IPV6_TO_CONTAINER_NAME,
+        )
+        is None
+    )
+
+
+def test_container_name_for_address_skips_malformed_addresses(caplog):
+    assert (
+        container_name_for_address(
+            track=Track(name="mock-track"),
+            address="9000:d37e:not-an-address",
+            ipv6_to_container_name=IPV6_TO_CONTAINER_NAME,
+        )
+        is None
+    )
+    assert "9000:d37e:not-an-address" in caplog.text
+    assert "mock-track" in caplog.text
@@ -0,0 +1,34 @@
+import pytest
+
+from ctf import ENV
+from ctf.common.utils import find_ctf_root_directory, get_challenges_directory
+from ctf.common.validators import TrailingSpacesForPostUser
+
+
+@pytest.fixture
+def challenges_directory(tmp_path, monkeypatch):
+    (tmp_path / ".deploy").mkdir()
+    (tmp_path / "challenges").mkdir()
+    monkeypatch.setitem(ENV, "CTF_ROOT_DIR", str(tmp_path))
+    find_ctf_root_directory.cache_clear()
+    get_challenges_directory.cache_clear()
+    yield tmp_path / "challenges"
+    find_ctf_root_directory.cache_clear()
+    get_challenges_directory.cache_clear()
+
+
+def test_trailing_spaces_for_post_user_without_posts(challenges_directory):
+    (challenges_directory / "mock-track").mkdir()
+
+    assert TrailingSpacesForPostUser().validate(track_name="mock-track") == []
+
+
+def test_trailing_spaces_for_post_user(challenges_directory):
+    (posts := challenges_directory / "mock-track" / "posts").mkdir(parents=True)
+    (posts / "mock-track.yaml").write_text("type: topic\nuser: mock-user \n")
+
+    errors = TrailingSpacesForPostUser().validate(track_name="mock-track")
+
+    assert [error.error_name for error in errors] == [
+        "Trailing spaces in post user name."
+    ]